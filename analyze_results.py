@@ -1,41 +1,500 @@
 #!/usr/bin/env python3
 """
 Analysis script for benchmark results.
-Reads results.csv and generates plots showing model performance.
+Reads results.csv (or a Parquet results store) and generates plots showing
+model performance. matplotlib and seaborn are only imported by the plot
+workers, so --summary_only starts without them.
 """
 
+import argparse
+import csv
+import hashlib
+import io
+import json
+import math
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import sys
 import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
-def load_results(csv_file="results/results.csv"):
-    """Load results from CSV file."""
-    if not os.path.exists(csv_file):
-        print(f"Error: {csv_file} not found. Run benchmark tests first.")
+import results_store
+
+# Columns the summary and plots use; nothing else is read
+ANALYSIS_COLUMNS = ['model_name', 'temperature', 'task_id', 'domain', 'result', 'pack_size',
+                    'ttft_s', 'answer_s', 'latency_s', 'load_s', 'prompt_tokens',
+                    'completion_tokens', 'sample_index', 'parsed_answer']
+
+# Aggregate state kept between runs (see update_aggregates)
+STATE_FILE = "results/analysis_state.json"
+STATE_VERSION = 5
+
+# Latency histograms: bucket k counts latencies up to
+# LATENCY_BUCKET_BASE * LATENCY_BUCKET_GROWTH ** k seconds, so percentiles
+# are accurate to one bucket (5%) and histograms add up across runs
+LATENCY_BUCKET_BASE = 0.001
+LATENCY_BUCKET_GROWTH = 1.05
+LATENCY_PERCENTILES = [50, 95, 99]
+
+# USD per million (prompt, completion) tokens, matched against model names
+# (longest match wins). List prices at the time of writing; use --prices to
+# supply current ones. Models without a price get no cost figures.
+MODEL_PRICES = {
+    'gpt-4': (30.00, 60.00),
+    'gpt-4-turbo': (10.00, 30.00),
+    'gpt-3.5-turbo': (0.50, 1.50),
+    'deepseek-chat': (0.27, 1.10),
+    'deepseek-coder': (0.27, 1.10),
+    'claude-3-haiku': (0.25, 1.25),
+    'claude-3-sonnet': (3.00, 15.00),
+    'claude-3-opus': (15.00, 75.00),
+}
+
+# Everything the summary and plots are derived from (see update_aggregates)
+Aggregates = namedtuple('Aggregates', ['cube', 'items', 'histograms', 'usage', 'answers'])
+
+# Bytes before the processed offset that are hashed to detect a rewritten CSV
+CSV_CHECK_BYTES = 4096
+
+def filter_rows(df, models=None, temperatures=None):
+    """Keep only the rows for ``models`` and ``temperatures`` (all if None)."""
+    if models:
+        df = df[df['model_name'].isin(models)]
+    if temperatures:
+        df = df[df['temperature'].isin(temperatures)]
+    return df
+
+def load_results(path="results/results.csv", columns=None, models=None, temperatures=None):
+    """Load results from a CSV file or a Parquet results store directory.
+
+    Only ``columns`` are read (all if None). ``models``/``temperatures``
+    restrict the rows; for a store, other partitions are never opened.
+    """
+    if not os.path.exists(path):
+        print(f"Error: {path} not found. Run benchmark tests first.")
         return None
     
     try:
-        df = pd.read_csv(csv_file)
-        print(f"Loaded {len(df)} results from {csv_file}")
+        if os.path.isdir(path):
+            df = results_store.read_table(path, columns=columns, models=models,
+                                          temperatures=temperatures).to_pandas()
+        else:
+            usecols = (lambda column: column in columns) if columns is not None else None
+            df = filter_rows(pd.read_csv(path, usecols=usecols), models, temperatures)
+        print(f"Loaded {len(df)} results from {path}")
         return df
     except Exception as e:
-        print(f"Error loading {csv_file}: {e}")
+        print(f"Error loading {path}: {e}")
         return None
 
-def plot_overall_accuracy(df, output_file="results/plot_overall_accuracy.png"):
-    """Generate bar chart showing overall accuracy for each model."""
+def csv_check_hash(path, offset):
+    """Hash of the bytes just before ``offset``, to detect in-place rewrites."""
+    start = max(0, offset - CSV_CHECK_BYTES)
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return hashlib.sha256(f.read(offset - start)).hexdigest()
+
+def read_csv_since(path, position, columns):
+    """Read the rows of a results CSV that ``position`` has not covered yet.
+
+    ``position`` holds the inode, byte offset and check hash recorded by the
+    previous read. If the file was replaced, truncated or rewritten the whole
+    file is read again. Only complete records are read, so a row still
+    being appended is picked up next time.
+    Returns (rows, new_position, incremental).
+    """
+    stat = os.stat(path)
+    incremental = (
+        position is not None
+        and position.get('inode') == stat.st_ino
+        and position.get('offset', 0) <= stat.st_size
+        and position.get('check') == csv_check_hash(path, position['offset'])
+    )
+    with open(path, 'rb') as f:
+        header = f.readline()
+        start = position['offset'] if incremental else len(header)
+        f.seek(start)
+        data = f.read()
+    data = data[:results_store.scan_csv_records(data)[0]]
+    end = start + len(data)
+
+    names = next(csv.reader([header.decode('utf-8')]))
+    usecols = [column for column in columns if column in names]
+    if data.strip():
+        df = pd.read_csv(io.BytesIO(data), header=None, names=names, usecols=usecols)
+    else:
+        df = pd.DataFrame(columns=usecols)
+    new_position = {'inode': stat.st_ino, 'offset': end, 'check': csv_check_hash(path, end)}
+    return df, new_position, incremental
+
+def read_store_since(store_dir, position, columns, models=None, temperatures=None):
+    """Read the files of a Parquet results store that ``position`` has not covered yet.
+
+    ``position`` maps each file already read to its inode and modification
+    time. Files are only ever added, or replaced whole when re-scored, so if
+    any of them is gone or replaced the whole store is read again.
+    Returns (rows, new_position, incremental).
+    """
+    files = {}
+    for name in results_store.data_files(store_dir):
+        stat = os.stat(os.path.join(store_dir, name))
+        files[name] = [stat.st_ino, stat.st_mtime_ns]
+    seen = position.get('files') if position is not None else None
+    # Positions written before files were signed hold a plain list
+    incremental = isinstance(seen, dict) and all(files.get(name) == signature
+                                                 for name, signature in seen.items())
+    new_files = [name for name in files if name not in seen] if incremental else list(files)
+    if new_files:
+        df = results_store.read_table(store_dir, columns=columns, models=models,
+                                      temperatures=temperatures, files=new_files).to_pandas()
+    else:
+        df = pd.DataFrame(columns=columns)
+    return df, {'files': files}, incremental
+
+def load_state(path):
+    """Load the aggregate state saved by a previous run, or None."""
+    try:
+        with open(path, 'r') as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return state if state.get('version') == STATE_VERSION else None
+
+def save_state(path, state):
+    """Write the aggregate state, atomically replacing the previous one."""
+    temp_file = path + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(state, f)
+    os.replace(temp_file, path)
+
+def update_aggregates(path, state, models=None, temperatures=None):
+    """Bring the aggregates up to date with the results at ``path``.
+
+    Only rows added since ``state`` was saved are read and merged into its
+    counts; the whole source is re-read if ``state`` is None, was built for
+    another source or filter, or the source was rewritten.
+    Returns (Aggregates, new_state), or None if the results cannot be read.
+    """
+    if not os.path.exists(path):
+        print(f"Error: {path} not found. Run benchmark tests first.")
+        return None
+
+    source = {'path': os.path.abspath(path), 'models': models, 'temperatures': temperatures}
+    if state is not None and state.get('source') != source:
+        state = None
+    position = state['position'] if state is not None else None
+
+    try:
+        if os.path.isdir(path):
+            df, position, incremental = read_store_since(path, position, ANALYSIS_COLUMNS,
+                                                         models, temperatures)
+        else:
+            df, position, incremental = read_csv_since(path, position, ANALYSIS_COLUMNS)
+            df = filter_rows(df, models, temperatures)
+    except Exception as e:
+        print(f"Error loading {path}: {e}")
+        return None
+
+    # Verify required columns exist
+    required_columns = ['model_name', 'temperature', 'domain', 'result']
+    missing_columns = [col for col in required_columns if col not in df.columns]
+    if missing_columns:
+        print(f"Error: Missing required columns: {missing_columns}")
+        return None
+
+    if incremental:
+        print(f"Loaded {len(df)} new results from {path}")
+    else:
+        print(f"Loaded {len(df)} results from {path}")
+
+    # Requests that failed in transport say nothing about the model's accuracy
+    transport_errors = df['result'] == 'Error'
+    if transport_errors.any():
+        print(f"Excluding {transport_errors.sum()} rows that failed in transport (result 'Error')")
+        df = df[~transport_errors]
+
+    cube = build_cube(df)
+    items = build_items(df)
+    histograms = build_histograms(df)
+    usage = build_usage(df)
+    answers = build_answers(df)
+    plots = {}
+    if incremental:
+        cube = merge_counts(CUBE_DIMENSIONS, pd.DataFrame(state['cube'], columns=cube.columns), cube)
+        items = pd.concat([pd.DataFrame(state['items'], columns=items.columns), items])
+        items = items.drop_duplicates().reset_index(drop=True)
+        histograms = merge_counts(HISTOGRAM_KEYS, pd.DataFrame(state['histograms'],
+                                                               columns=histograms.columns), histograms)
+        usage = merge_counts(USAGE_KEYS, pd.DataFrame(state['usage'], columns=usage.columns), usage)
+        answers = merge_counts(ANSWER_KEYS, pd.DataFrame(state['answers'], columns=answers.columns),
+                               answers)
+        plots = state.get('plots', {})
+
+    new_state = {
+        'version': STATE_VERSION,
+        'source': source,
+        'position': position,
+        'cube': cube.to_dict('records'),
+        'items': items.to_dict('records'),
+        'histograms': histograms.to_dict('records'),
+        'usage': usage.to_dict('records'),
+        'answers': answers.to_dict('records'),
+        'plots': plots,
+    }
+    return Aggregates(cube, items, histograms, usage, answers), new_state
+
+def export_csv(df, output_file):
+    """Write results to a CSV file, atomically replacing any existing file."""
+    temp_file = output_file + '.tmp'
+    df.to_csv(temp_file, index=False)
+    os.replace(temp_file, output_file)
+    print(f"Exported {len(df)} results to {output_file}")
+
+# Dimensions of the aggregation cube every plot and summary table is built from
+CUBE_DIMENSIONS = ['model_name', 'temperature', 'domain', 'pack_size']
+
+def build_cube(df):
+    """Count correct and total results for every cube cell in one pass.
+
+    Returns one row per (model_name, temperature, domain, pack_size) with
+    'correct' and 'total' columns. Rows recorded before pack sizes were
+    stored have a missing pack_size.
+    """
+    if 'pack_size' not in df.columns:
+        df = df.assign(pack_size=float('nan'))
+    return (
+        df.assign(correct=df['result'].eq('Correct'))
+        .groupby(CUBE_DIMENSIONS, dropna=False)['correct']
+        .agg(correct='sum', total='size')
+        .reset_index()
+    )
+
+def build_items(df):
+    """Distinct (task_id, domain) pairs, for the item counts in titles and the summary."""
+    return df[['task_id', 'domain']].drop_duplicates().reset_index(drop=True)
+
+# Keys of the latency histograms and of the token usage sums
+HISTOGRAM_KEYS = ['model_name', 'temperature', 'metric', 'bucket']
+USAGE_KEYS = ['model_name', 'temperature']
+
+def build_histograms(df):
+    """Count request latencies (latency_s and ttft_s) into log-spaced buckets.
+
+    Returns one row per (model_name, temperature, metric, bucket) with a
+    'count' column. Rows without the metric (cache hits, older results) are
+    not counted. Time Ollama spent loading the model (load_s) is taken out,
+    so the percentiles are inference time only.
+    """
+    load_s = model_load_seconds(df)
+    frames = []
+    for metric in ('latency_s', 'ttft_s'):
+        if metric not in df.columns:
+            continue
+        values = (pd.to_numeric(df[metric], errors='coerce') - load_s).dropna()
+        buckets = np.ceil(
+            np.log(values.clip(lower=LATENCY_BUCKET_BASE) / LATENCY_BUCKET_BASE)
+            / np.log(LATENCY_BUCKET_GROWTH)
+        ).astype(int)
+        frames.append(pd.DataFrame({
+            'model_name': df.loc[values.index, 'model_name'],
+            'temperature': df.loc[values.index, 'temperature'],
+            'metric': metric,
+            'bucket': buckets,
+        }))
+    if not frames:
+        return pd.DataFrame(columns=HISTOGRAM_KEYS + ['count'])
+    return pd.concat(frames).groupby(HISTOGRAM_KEYS).size().rename('count').reset_index()
+
+def model_load_seconds(df):
+    """Per-row time spent loading the model (0 where none was recorded)."""
+    if 'load_s' not in df.columns:
+        return pd.Series(0.0, index=df.index)
+    return pd.to_numeric(df['load_s'], errors='coerce').fillna(0)
+
+def build_usage(df):
+    """Sum token usage and model load time per (model_name, temperature).
+
+    A packed request's tokens and time are shared by its items, so each row
+    counts 1/pack_size of them. 'usage_items' counts the rows with recorded
+    usage; 'generated_tokens' and 'generation_s' cover the rows that also
+    have a request time, for tokens per second, and leave out model loading,
+    which is summed separately in 'load_s'.
+    """
+    columns = USAGE_KEYS + ['usage_items', 'prompt_tokens', 'completion_tokens',
+                            'generated_tokens', 'generation_s', 'load_s']
+    if 'completion_tokens' not in df.columns:
+        return pd.DataFrame(columns=columns)
+    pack_size = df['pack_size'] if 'pack_size' in df.columns else pd.Series(1, index=df.index)
+    share = 1 / pd.to_numeric(pack_size, errors='coerce').fillna(1)
+    prompt_tokens = pd.to_numeric(df['prompt_tokens'], errors='coerce') * share
+    completion_tokens = pd.to_numeric(df['completion_tokens'], errors='coerce') * share
+    load_s = model_load_seconds(df) * share
+    generation_s = pd.to_numeric(df['answer_s'], errors='coerce') * share - load_s
+    has_usage = completion_tokens.notna()
+    timed = has_usage & generation_s.notna()
+    usage = pd.DataFrame({
+        'model_name': df['model_name'],
+        'temperature': df['temperature'],
+        'usage_items': has_usage.astype(int),
+        'prompt_tokens': prompt_tokens.where(has_usage, 0).fillna(0),
+        'completion_tokens': completion_tokens.fillna(0),
+        'generated_tokens': completion_tokens.where(timed, 0),
+        'generation_s': generation_s.where(timed, 0),
+        'load_s': load_s,
+    })
+    return usage.groupby(USAGE_KEYS).sum().reset_index()[columns]
+
+# Keys of the answer counts behind majority vote and pass@k
+ANSWER_KEYS = ['model_name', 'temperature', 'task_id', 'answer', 'correct']
+
+def build_answers(df):
+    """Count how often each run gave each distinct answer to each item.
+
+    Returns one row per (model_name, temperature, task_id, answer, correct)
+    with a 'count' column, where 'answer' is the stored parsed answer ('' if
+    none was stored). Only rows from --samples runs (those with a
+    sample_index) are counted, so single-sample results add nothing to the
+    saved state.
+    """
+    if 'sample_index' not in df.columns:
+        return pd.DataFrame(columns=ANSWER_KEYS + ['count'])
+    df = df[df['sample_index'].notna()]
+    answer = df['parsed_answer'] if 'parsed_answer' in df.columns else pd.Series('', index=df.index)
+    answers = pd.DataFrame({
+        'model_name': df['model_name'],
+        'temperature': df['temperature'],
+        'task_id': df['task_id'],
+        'answer': answer.fillna('').astype(str),
+        'correct': df['result'].eq('Correct'),
+    })
+    return answers.groupby(ANSWER_KEYS).size().rename('count').reset_index()
+
+def merge_counts(keys, *tables):
+    """Add up the counts of several aggregate tables row by row on ``keys``."""
+    return pd.concat(tables).groupby(keys, dropna=False).sum().reset_index()
+
+def rollup(cube, by):
+    """Sum the cube over every dimension not in ``by`` and add accuracy (%)."""
+    totals = cube.groupby(by, dropna=False)[['correct', 'total']].sum()
+    totals['accuracy'] = totals['correct'] / totals['total'] * 100
+    return totals
+
+def histogram_percentiles(histograms, metric):
+    """Per-model LATENCY_PERCENTILES of ``metric`` (seconds) from the histograms."""
+    counts = histograms[histograms['metric'] == metric].groupby(['model_name', 'bucket'])['count'].sum()
+    percentiles = {}
+    for model, model_counts in counts.groupby(level='model_name'):
+        model_counts = model_counts.droplevel('model_name').sort_index()
+        cumulative = (model_counts.cumsum() / model_counts.sum()).to_numpy()
+        buckets = model_counts.index.to_numpy()
+        percentiles[model] = {
+            f'p{p}': LATENCY_BUCKET_BASE * LATENCY_BUCKET_GROWTH ** buckets[np.argmax(cumulative >= p / 100)]
+            for p in LATENCY_PERCENTILES
+        }
+    return pd.DataFrame.from_dict(percentiles, orient='index',
+                                  columns=[f'p{p}' for p in LATENCY_PERCENTILES])
+
+def model_price(model, prices):
+    """(prompt, completion) USD per million tokens for a model, or None."""
+    matches = [name for name in prices if name in model]
+    return prices[max(matches, key=len)] if matches else None
+
+def model_metrics(aggregates, prices):
+    """Per-model latency percentiles, throughput and cost.
+
+    Columns: p50/p95/p99 latency and ttft_p50 (seconds, without model
+    loading), load_s (total seconds spent loading the model during timed
+    requests), tokens_per_s, tokens_per_item (completion tokens) and
+    cost_per_correct (USD, scaled from the items with recorded usage to all
+    items). Empty if no request metrics were recorded.
+    """
+    latency = histogram_percentiles(aggregates.histograms, 'latency_s')
+    if latency.empty:
+        return pd.DataFrame()
+    metrics = latency.join(
+        histogram_percentiles(aggregates.histograms, 'ttft_s')['p50'].rename('ttft_p50'), how='left'
+    )
+
+    usage = aggregates.usage.groupby('model_name')[
+        ['usage_items', 'prompt_tokens', 'completion_tokens', 'generated_tokens', 'generation_s',
+         'load_s']
+    ].sum()
+    metrics['load_s'] = usage['load_s']
+    accuracy = rollup(aggregates.cube, 'model_name')
+    usage = usage.join(accuracy[['correct', 'total']], how='left')
+    usage = usage[usage['usage_items'] > 0]
+    metrics['tokens_per_s'] = (usage['generated_tokens'] / usage['generation_s']).replace(np.inf, np.nan)
+    metrics['tokens_per_item'] = usage['completion_tokens'] / usage['usage_items']
+
+    cost_per_correct = {}
+    for model, row in usage.iterrows():
+        price = model_price(model, prices)
+        if price is None or not row['correct']:
+            continue
+        cost = (row['prompt_tokens'] * price[0] + row['completion_tokens'] * price[1]) / 1e6
+        cost_per_correct[model] = cost / row['usage_items'] * row['total'] / row['correct']
+    metrics['cost_per_correct'] = pd.Series(cost_per_correct, dtype=float)
+    return metrics.sort_values('p50')
+
+def pass_at_k(samples, correct, k):
+    """Unbiased estimate of the chance that at least one of k samples is correct."""
+    if samples - correct < k:
+        return 1.0
+    return 1 - math.comb(samples - correct, k) / math.comb(samples, k)
+
+def sampling_metrics(answers):
+    """Accuracy over repeated samples per (model_name, temperature).
+
+    Only items with more than one sample count. Columns: 'items', 'samples'
+    (k, the fewest samples any of those items has), 'pass_at_1' and
+    'pass_at_k' (%), and 'majority' (%): how often the most frequent answer
+    is correct, with ties split evenly. Empty if no item has repeated
+    samples.
+    """
+    item_keys = ['model_name', 'temperature', 'task_id']
+    counts = answers.groupby(ANSWER_KEYS)['count'].sum().reset_index()
+    counts['correct_count'] = counts['count'].where(counts['correct'].astype(bool), 0)
+    per_item = counts.groupby(item_keys)[['count', 'correct_count']].sum()
+    per_item = per_item[per_item['count'] > 1]
+    if per_item.empty:
+        return pd.DataFrame()
+
+    top = counts[counts['count'] == counts.groupby(item_keys)['count'].transform('max')]
+    per_item['majority'] = top.groupby(item_keys)['correct'].mean()
+
+    rows = {}
+    for run, run_items in per_item.groupby(level=['model_name', 'temperature']):
+        k = int(run_items['count'].min())
+        rows[run] = {
+            'items': len(run_items),
+            'samples': k,
+            'pass_at_1': (run_items['correct_count'] / run_items['count']).mean() * 100,
+            'pass_at_k': np.mean([pass_at_k(n, c, k) for n, c in
+                                  zip(run_items['count'], run_items['correct_count'])]) * 100,
+            'majority': run_items['majority'].mean() * 100,
+        }
+    return pd.DataFrame.from_dict(rows, orient='index').sort_values('majority', ascending=False)
+
+def load_prices(path):
+    """Read model prices from a JSON file: {"model": [prompt, completion], ...} in USD per million tokens."""
+    with open(path, 'r') as f:
+        return {model: tuple(price) for model, price in json.load(f).items()}
+
+def plot_overall_accuracy(by_model, items, output_file="results/plot_overall_accuracy.png"):
+    """Generate bar chart showing overall accuracy for each model.
+
+    ``by_model`` is rollup(cube, 'model_name').
+    """
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(12, 6))
     
-    # Calculate accuracy by model
-    accuracy_by_model = df.groupby('model_name').apply(
-        lambda x: (x['result'] == 'Correct').sum() / len(x) * 100
-    ).sort_values(ascending=False)
-    
-    # Calculate sample sizes
-    sample_sizes = df.groupby('model_name').size()
-    total_items = len(df[['task_id']].drop_duplicates())
+    # Accuracy and sample sizes by model
+    by_model = by_model.sort_values('accuracy', ascending=False)
+    accuracy_by_model = by_model['accuracy']
+    sample_sizes = by_model['total']
+    total_items = items['task_id'].nunique()
     
     # Define which models are local
     local_models = {'gemma3:270m', 'gemma3:4b', 'gemma3:12b', 'gpt-oss:20b'}
@@ -76,16 +535,20 @@ def plot_overall_accuracy(df, output_file="results/plot_overall_accuracy.png"):
     plt.close()
     print(f"Saved overall accuracy plot to {output_file}")
 
-def plot_temperature_comparison(df, output_file="results/plot_temperature_comparison.png"):
-    """Generate grouped bar chart comparing accuracy at different temperatures."""
+def plot_temperature_comparison(by_model_temperature, items,
+                                output_file="results/plot_temperature_comparison.png"):
+    """Generate grouped bar chart comparing accuracy at different temperatures.
+
+    ``by_model_temperature`` is rollup(cube, ['model_name', 'temperature']).
+    """
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(14, 6))
     
-    # Calculate accuracy by model and temperature
-    accuracy_pivot = df.groupby(['model_name', 'temperature']).apply(
-        lambda x: (x['result'] == 'Correct').sum() / len(x) * 100
-    ).unstack(fill_value=0)
+    # Accuracy by model and temperature
+    accuracy_pivot = by_model_temperature['accuracy'].unstack(fill_value=0)
     
-    total_items = len(df[['task_id']].drop_duplicates())
+    total_items = items['task_id'].nunique()
     
     ax = accuracy_pivot.plot(kind='bar', width=0.8, colormap='viridis', alpha=0.8)
     plt.xlabel('LLM', fontsize=12, fontweight='bold')
@@ -105,18 +568,22 @@ def plot_temperature_comparison(df, output_file="results/plot_temperature_compar
     plt.close()
     print(f"Saved temperature comparison plot to {output_file}")
 
-def plot_domain_performance(df, output_file="results/plot_domain_performance.png"):
-    """Generate heatmap showing accuracy by model and domain."""
+def plot_domain_performance(by_model_domain, items, output_file="results/plot_domain_performance.png"):
+    """Generate heatmap showing accuracy by model and domain.
+
+    ``by_model_domain`` is rollup(cube, ['model_name', 'domain']).
+    """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     plt.figure(figsize=(16, 8))
     
-    # Calculate accuracy by model and domain
-    domain_accuracy = df.groupby(['model_name', 'domain']).apply(
-        lambda x: (x['result'] == 'Correct').sum() / len(x) * 100
-    ).unstack(fill_value=0)
+    # Accuracy by model and domain
+    domain_accuracy = by_model_domain['accuracy'].unstack(fill_value=0)
     
-    # Calculate domain sample sizes for subtitle
-    domain_counts = df.groupby('domain')['task_id'].nunique().sort_values(ascending=False)
-    total_items = len(df[['task_id']].drop_duplicates())
+    # Domain sample sizes for subtitle
+    domain_counts = items.groupby('domain')['task_id'].nunique().sort_values(ascending=False)
+    total_items = items['task_id'].nunique()
     domain_info = ', '.join([f'{domain}: {count}' for domain, count in domain_counts.head(3).items()])
     
     # Create heatmap
@@ -135,18 +602,140 @@ def plot_domain_performance(df, output_file="results/plot_domain_performance.png
     plt.close()
     print(f"Saved domain performance heatmap to {output_file}")
 
-def print_summary(df):
-    """Print a summary of the results to console."""
+def plot_latency_percentiles(latency, output_file="results/plot_latency.png"):
+    """Generate grouped bar chart of p50/p95/p99 request latency for each model."""
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(12, 6))
+    ax = latency.plot(kind='bar', width=0.8, colormap='viridis', alpha=0.8)
+    plt.xlabel('LLM', fontsize=12, fontweight='bold')
+    plt.ylabel('Latency per request (s)', fontsize=12, fontweight='bold')
+    plt.title('Stata Knowledge Benchmark: Request Latency\nPercentiles by Model',
+              fontsize=14, fontweight='bold', pad=20)
+    plt.legend(title='Percentile', bbox_to_anchor=(1.05, 1), loc='upper left', title_fontsize=12)
+    plt.xticks(rotation=45, ha='right')
+    plt.grid(axis='y', alpha=0.3, linestyle='--')
+    
+    for container in ax.containers:
+        ax.bar_label(container, fmt='%.2f', rotation=0, padding=3, fontsize=8)
+    
+    plt.tight_layout()
+    plt.savefig(output_file, dpi=300, bbox_inches='tight')
+    plt.close()
+    print(f"Saved latency plot to {output_file}")
+
+def plot_throughput_cost(throughput_cost, output_file="results/plot_throughput_cost.png"):
+    """Generate side-by-side bar charts of tokens per second and cost per correct answer."""
+    import matplotlib.pyplot as plt
+
+    fig, (ax_speed, ax_cost) = plt.subplots(1, 2, figsize=(14, 6))
+    
+    speed = throughput_cost['tokens_per_s'].dropna().sort_values()
+    ax_speed.barh(speed.index, speed.values, color='skyblue', edgecolor='navy', alpha=0.7)
+    ax_speed.set_xlabel('Completion tokens per second', fontsize=12, fontweight='bold')
+    ax_speed.set_title('Throughput', fontsize=13)
+    
+    cost = throughput_cost['cost_per_correct'].dropna().sort_values()
+    ax_cost.barh(cost.index, cost.values, color='lightcoral', edgecolor='darkred', alpha=0.7)
+    ax_cost.set_xlabel('USD per correct answer', fontsize=12, fontweight='bold')
+    ax_cost.set_title('Cost (priced models only)', fontsize=13)
+    
+    for ax in (ax_speed, ax_cost):
+        ax.grid(axis='x', alpha=0.3, linestyle='--')
+        ax.spines['top'].set_visible(False)
+        ax.spines['right'].set_visible(False)
+    fig.suptitle('Stata Knowledge Benchmark: Throughput and Cost by Model',
+                 fontsize=14, fontweight='bold')
+    
+    plt.tight_layout()
+    plt.savefig(output_file, dpi=300, bbox_inches='tight')
+    plt.close()
+    print(f"Saved throughput and cost plot to {output_file}")
+
+# Each plot: (function, output file, function returning the data it is drawn
+# from given the aggregates and model_metrics(), or None to skip the plot)
+PLOTS = [
+    (plot_overall_accuracy, "results/plot_overall_accuracy.png",
+     lambda aggregates, metrics: (rollup(aggregates.cube, 'model_name'), aggregates.items)),
+    (plot_temperature_comparison, "results/plot_temperature_comparison.png",
+     lambda aggregates, metrics: (rollup(aggregates.cube, ['model_name', 'temperature']),
+                                  aggregates.items)),
+    (plot_domain_performance, "results/plot_domain_performance.png",
+     lambda aggregates, metrics: (rollup(aggregates.cube, ['model_name', 'domain']),
+                                  aggregates.items)),
+    (plot_latency_percentiles, "results/plot_latency.png",
+     lambda aggregates, metrics: (metrics[[f'p{p}' for p in LATENCY_PERCENTILES]],)
+     if not metrics.empty else None),
+    (plot_throughput_cost, "results/plot_throughput_cost.png",
+     lambda aggregates, metrics: (metrics[['tokens_per_s', 'cost_per_correct']],)
+     if not metrics.empty else None),
+]
+
+def plot_data_hash(data):
+    """Hash of everything a plot is drawn from, to skip redrawing unchanged plots."""
+    digest = hashlib.sha256()
+    for frame in data:
+        digest.update(frame.to_csv().encode('utf-8'))
+    return digest.hexdigest()
+
+def render_plot(plot, data, output_file):
+    """Draw one plot in a worker process."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    # Set matplotlib style
+    plt.style.use('default')
+    sns.set_palette("husl")
+    plot(*data, output_file)
+
+def draw_plots(aggregates, metrics, rendered, workers=None):
+    """Draw every plot whose data changed since it was last rendered.
+
+    Each plot is rendered in its own worker process, up to ``workers`` at
+    once (default: one per plot). ``rendered`` maps output files to the data
+    hash they were drawn from and is updated in place.
+    """
+    pending = []
+    for plot, output_file, plot_data in PLOTS:
+        data = plot_data(aggregates, metrics)
+        if data is None:
+            continue
+        data_hash = plot_data_hash(data)
+        if rendered.get(output_file) == data_hash and os.path.exists(output_file):
+            print(f"Unchanged, kept {output_file}")
+        else:
+            pending.append((plot, data, output_file, data_hash))
+    if not pending:
+        return
+
+    with ProcessPoolExecutor(max_workers=workers or len(pending)) as executor:
+        futures = [
+            (executor.submit(render_plot, plot, data, output_file), output_file, data_hash)
+            for plot, data, output_file, data_hash in pending
+        ]
+        for future, output_file, data_hash in futures:
+            future.result()
+            rendered[output_file] = data_hash
+
+def print_summary(aggregates, metrics, plots=True):
+    """Print a summary of the results to console.
+
+    ``metrics`` is model_metrics() for the latency, throughput and cost
+    tables. The list of generated plots is left out when ``plots`` is False.
+    """
+    cube, items = aggregates.cube, aggregates.items
     print("\n" + "="*70)
     print("STATA KNOWLEDGE BENCHMARK - EVALUATION RESULTS")
     print("="*70)
     
     # Overall statistics
-    total_tests = len(df)
-    unique_items = len(df[['task_id']].drop_duplicates())
-    unique_models = df['model_name'].nunique()
-    unique_temps = df['temperature'].nunique()
-    unique_domains = df['domain'].nunique()
+    total_tests = int(cube['total'].sum())
+    unique_items = items['task_id'].nunique()
+    unique_models = cube['model_name'].nunique()
+    unique_temps = cube['temperature'].nunique()
+    unique_domains = cube['domain'].nunique()
     
     print(f"Benchmark Items Evaluated: {unique_items}")
     print(f"Total Test Runs: {total_tests}")
@@ -158,87 +747,147 @@ def print_summary(df):
     # Overall accuracy by model
     print("OVERALL ACCURACY BY MODEL:")
     print("-" * 40)
-    overall_accuracy = df.groupby('model_name').apply(
-        lambda x: (x['result'] == 'Correct').sum() / len(x) * 100
-    ).sort_values(ascending=False)
+    overall_accuracy = rollup(cube, 'model_name').sort_values('accuracy', ascending=False)
     
-    for model, accuracy in overall_accuracy.items():
-        total_questions = len(df[df['model_name'] == model])
-        correct_answers = (df[df['model_name'] == model]['result'] == 'Correct').sum()
-        print(f"{model:30} {accuracy:6.1f}% ({correct_answers}/{total_questions})")
+    for model, row in overall_accuracy.iterrows():
+        print(f"{model:30} {row['accuracy']:6.1f}% ({int(row['correct'])}/{int(row['total'])})")
     
     # Accuracy by temperature (if multiple temperatures tested)
     if unique_temps > 1:
         print("\nACCURACY BY TEMPERATURE:")
         print("-" * 40)
-        temp_accuracy = df.groupby('temperature').apply(
-            lambda x: (x['result'] == 'Correct').sum() / len(x) * 100
-        ).sort_index()
+        temp_accuracy = rollup(cube, 'temperature').sort_index()
         
-        for temp, accuracy in temp_accuracy.items():
-            total_questions = len(df[df['temperature'] == temp])
-            correct_answers = (df[df['temperature'] == temp]['result'] == 'Correct').sum()
-            print(f"Temperature {temp:4.1f}:        {accuracy:6.1f}% ({correct_answers}/{total_questions})")
+        for temp, row in temp_accuracy.iterrows():
+            print(f"Temperature {temp:4.1f}:        {row['accuracy']:6.1f}% "
+                  f"({int(row['correct'])}/{int(row['total'])})")
     
     # Best performing model-temperature combinations
     if unique_temps > 1 and unique_models > 1:
         print("\nBEST MODEL-TEMPERATURE COMBINATIONS:")
         print("-" * 50)
-        combo_accuracy = df.groupby(['model_name', 'temperature']).apply(
-            lambda x: (x['result'] == 'Correct').sum() / len(x) * 100
-        ).sort_values(ascending=False).head(5)
+        combo_accuracy = rollup(cube, ['model_name', 'temperature']).sort_values(
+            'accuracy', ascending=False
+        ).head(5)
+        
+        for (model, temp), row in combo_accuracy.iterrows():
+            print(f"{model} (T={temp}): {row['accuracy']:6.1f}% "
+                  f"({int(row['correct'])}/{int(row['total'])})")
+    
+    # Accuracy by items per request (if packed runs were recorded)
+    if cube['pack_size'].nunique() > 1:
+        print("\nACCURACY BY ITEMS PER REQUEST:")
+        print("-" * 40)
+        pack_accuracy = rollup(cube.dropna(subset=['pack_size']), 'pack_size').sort_index()
         
-        for (model, temp), accuracy in combo_accuracy.items():
-            subset = df[(df['model_name'] == model) & (df['temperature'] == temp)]
-            total_questions = len(subset)
-            correct_answers = (subset['result'] == 'Correct').sum()
-            print(f"{model} (T={temp}): {accuracy:6.1f}% ({correct_answers}/{total_questions})")
-    
-    print("\nVisualization Files Generated:")
-    print("- results/plot_overall_accuracy.png      (Overall model rankings)")
-    print("- results/plot_temperature_comparison.png (Temperature sensitivity)")
-    print("- results/plot_domain_performance.png    (Domain-specific heatmap)")
+        for pack_size, row in pack_accuracy.iterrows():
+            print(f"Pack size {int(pack_size):3}:        {row['accuracy']:6.1f}% "
+                  f"({int(row['correct'])}/{int(row['total'])})")
+    
+    # Majority vote and pass@k (if items were sampled more than once)
+    sampling = sampling_metrics(aggregates.answers)
+    if not sampling.empty:
+        print("\nREPEATED SAMPLES (majority vote and pass@k):")
+        print("-" * 70)
+        print(f"{'':30} {'T':>5} {'k':>4} {'pass@1':>8} {'pass@k':>8} {'majority':>9}")
+        for (model, temp), row in sampling.iterrows():
+            print(f"{model:30} {temp:5.1f} {int(row['samples']):4} {row['pass_at_1']:7.1f}% "
+                  f"{row['pass_at_k']:7.1f}% {row['majority']:8.1f}%")
+    
+    # Latency, throughput and cost (if request metrics were recorded)
+    if not metrics.empty:
+        print("\nLATENCY BY MODEL (seconds per request):")
+        print("-" * 70)
+        print(f"{'':30} {'p50':>8} {'p95':>8} {'p99':>8} {'TTFT p50':>10} {'load total':>11}")
+        for model, row in metrics.iterrows():
+            ttft = f"{row['ttft_p50']:10.2f}" if pd.notna(row['ttft_p50']) else f"{'-':>10}"
+            load = f"{row['load_s']:11.2f}" if row['load_s'] > 0 else f"{'-':>11}"
+            print(f"{model:30} {row['p50']:8.2f} {row['p95']:8.2f} {row['p99']:8.2f} {ttft} {load}")
+        
+        print("\nTHROUGHPUT AND COST BY MODEL:")
+        print("-" * 70)
+        print(f"{'':30} {'tokens/s':>10} {'tokens/item':>12} {'USD/correct':>12}")
+        for model, row in metrics.iterrows():
+            speed = f"{row['tokens_per_s']:10.1f}" if pd.notna(row['tokens_per_s']) else f"{'-':>10}"
+            tokens = f"{row['tokens_per_item']:12.1f}" if pd.notna(row['tokens_per_item']) else f"{'-':>12}"
+            cost = f"{row['cost_per_correct']:12.5f}" if pd.notna(row['cost_per_correct']) else f"{'-':>12}"
+            print(f"{model:30} {speed} {tokens} {cost}")
+    
+    if plots:
+        print("\nVisualization Files Generated:")
+        print("- results/plot_overall_accuracy.png      (Overall model rankings)")
+        print("- results/plot_temperature_comparison.png (Temperature sensitivity)")
+        print("- results/plot_domain_performance.png    (Domain-specific heatmap)")
+        if not metrics.empty:
+            print("- results/plot_latency.png               (Latency percentiles)")
+            print("- results/plot_throughput_cost.png       (Throughput and cost per correct answer)")
     print("="*70)
 
 def main():
     """Main function to analyze benchmark results."""
-    # Check if pandas and matplotlib are available
-    try:
-        import pandas as pd
-        import matplotlib.pyplot as plt
-        import seaborn as sns
-    except ImportError as e:
-        print("Error: Required libraries not found.")
-        print("Please install them with: pip install pandas matplotlib seaborn")
-        sys.exit(1)
-    
+    parser = argparse.ArgumentParser(description='Analyze benchmark results')
+    parser.add_argument('--results', type=str, default='results/results.csv',
+                       help='Results CSV file or Parquet results store directory')
+    parser.add_argument('--models', type=str, help='Comma-separated models to include (default: all)')
+    parser.add_argument('--temperatures', type=str,
+                       help='Comma-separated temperatures to include (default: all)')
+    parser.add_argument('--export_csv', type=str, metavar='PATH',
+                       help='Write the selected results, all columns, to a CSV file and exit')
+    parser.add_argument('--state_file', type=str, default=STATE_FILE,
+                       help=f'Aggregate state kept between runs (default: {STATE_FILE})')
+    parser.add_argument('--full', action='store_true',
+                       help='Ignore the saved state and re-read all results')
+    parser.add_argument('--summary_only', action='store_true',
+                       help='Print the summary without drawing plots (does not import matplotlib)')
+    parser.add_argument('--plot_workers', type=int,
+                       help='Processes used to draw plots (default: one per plot)')
+    parser.add_argument('--prices', type=str, metavar='PATH',
+                       help='JSON file of USD per million [prompt, completion] tokens by model '
+                            '(default: built-in list prices)')
+    args = parser.parse_args()
+    models = [m.strip() for m in args.models.split(',') if m.strip()] if args.models else None
+    temperatures = ([float(t) for t in args.temperatures.split(',') if t.strip()]
+                    if args.temperatures else None)
+
+    # Check if matplotlib and seaborn are available for the plots
+    if not args.summary_only and not args.export_csv:
+        try:
+            import matplotlib
+            import seaborn
+        except ImportError as e:
+            print("Error: Required libraries not found.")
+            print("Please install them with: pip install pandas matplotlib seaborn")
+            sys.exit(1)
+    
+    if args.export_csv:
+        df = load_results(args.results, models=models, temperatures=temperatures)
+        if df is None:
+            sys.exit(1)
+        export_csv(df, args.export_csv)
+        return
+
     # Ensure results directory exists
     os.makedirs('results', exist_ok=True)
     
-    # Set matplotlib style
-    plt.style.use('default')
-    sns.set_palette("husl")
-    
-    # Load results
-    df = load_results("results/results.csv")
-    if df is None:
+    # Load only the rows added since the last run and merge them into the saved counts
+    state = None if args.full else load_state(args.state_file)
+    aggregates = update_aggregates(args.results, state, models, temperatures)
+    if aggregates is None:
         sys.exit(1)
-    
-    # Verify required columns exist
-    required_columns = ['model_name', 'temperature', 'domain', 'result']
-    missing_columns = [col for col in required_columns if col not in df.columns]
-    if missing_columns:
-        print(f"Error: Missing required columns: {missing_columns}")
+    aggregates, state = aggregates
+    if aggregates.cube.empty:
+        print("Error: No results to analyze.")
         sys.exit(1)
-    
+    metrics = model_metrics(aggregates, load_prices(args.prices) if args.prices else MODEL_PRICES)
+
     # Generate plots
-    print("\nGenerating analysis plots...")
-    plot_overall_accuracy(df)
-    plot_temperature_comparison(df)
-    plot_domain_performance(df)
+    if not args.summary_only:
+        print("\nGenerating analysis plots...")
+        draw_plots(aggregates, metrics, state['plots'], workers=args.plot_workers)
+    save_state(args.state_file, state)
     
     # Print summary
-    print_summary(df)
+    print_summary(aggregates, metrics, plots=not args.summary_only)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
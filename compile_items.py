@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Item bank compiler.
+Validates items.jsonl and compiles it into an indexed SQLite item bank with
+every item's prompt and answer schema pre-rendered, which run_benchmark.py
+reads instead of items.jsonl to load filtered or sharded subsets quickly.
+"""
+
+import argparse
+import json
+import sys
+
+import item_bank
+from run_benchmark import (ITEMS_FILE, build_answer_schema, build_prompt, build_question_text,
+                           schema_hint)
+
+REQUIRED_FIELDS = ['task_id', 'module', 'domain', 'prompt', 'answer_type', 'scoring']
+
+# Scoring methods score_response() supports for each answer type
+SCORING_METHODS = {
+    'multiple_choice': ['choice_equals_index'],
+    'structured_single': ['numeric_match', 'phrase_match'],
+}
+
+def validate_item(item):
+    """Problems that would stop an item from being asked or scored; empty if none."""
+    problems = [f"missing field '{field}'" for field in REQUIRED_FIELDS if field not in item]
+    if problems:
+        return problems
+
+    answer_type = item['answer_type']
+    method = item['scoring'].get('method') if isinstance(item['scoring'], dict) else None
+    if answer_type not in SCORING_METHODS:
+        return [f"unknown answer_type '{answer_type}'"]
+    if method not in SCORING_METHODS[answer_type]:
+        problems.append(f"scoring method '{method}' does not apply to {answer_type} items")
+
+    if answer_type == 'multiple_choice':
+        choices = item.get('choices')
+        if not isinstance(choices, list) or len(choices) < 2:
+            problems.append("needs a list of at least two choices")
+        elif not isinstance(item.get('correct_index'), int) or not 0 <= item['correct_index'] < len(choices):
+            problems.append(f"correct_index {item.get('correct_index')!r} is not the index of a choice")
+    else: # structured_single
+        properties = item.get('output_schema', {}).get('properties')
+        if not properties or not all(isinstance(spec, dict) and 'type' in spec
+                                     for spec in properties.values()):
+            problems.append("output_schema needs properties, each with a type")
+        if method == 'numeric_match' and 'expected_value' not in item['scoring']:
+            problems.append("numeric_match scoring needs an expected_value")
+        if method == 'phrase_match' and not item['scoring'].get('accepted_phrases'):
+            problems.append("phrase_match scoring needs accepted_phrases")
+
+    if 'difficulty' in item and not isinstance(item['difficulty'], int):
+        problems.append(f"difficulty {item['difficulty']!r} is not an integer")
+    if not isinstance(item.get('tags', []), list):
+        problems.append("tags is not a list")
+    return problems
+
+def compile_items(items_file=ITEMS_FILE):
+    """Validate and render every item; returns (records, problems)."""
+    records = []
+    problems = []
+    seen = set()
+    with open(items_file, 'r') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                problems.append(f"line {line_number}: invalid JSON ({e})")
+                continue
+            label = f"line {line_number} ({item.get('task_id', 'no task_id')})"
+            item_problems = validate_item(item)
+            if item.get('task_id') in seen:
+                item_problems.append("duplicate task_id")
+            seen.add(item.get('task_id'))
+            if item_problems:
+                problems.extend(f"{label}: {problem}" for problem in item_problems)
+                continue
+            records.append({
+                'item': item,
+                'prompt': build_prompt(item),
+                'question_text': build_question_text(item),
+                'schema_hint': schema_hint(item),
+                'answer_schema': build_answer_schema(item),
+            })
+    return records, problems
+
+def main():
+    """Main function to compile the item bank."""
+    parser = argparse.ArgumentParser(description='Validate items.jsonl and compile it into an indexed item bank')
+    parser.add_argument('--items_file', type=str, default=ITEMS_FILE,
+                       help=f'Items to compile (default: {ITEMS_FILE})')
+    parser.add_argument('--output', type=str, default=item_bank.ITEM_BANK,
+                       help=f'Item bank to write (default: {item_bank.ITEM_BANK})')
+    parser.add_argument('--check', action='store_true',
+                       help='Only validate the items; do not write the bank')
+    args = parser.parse_args()
+
+    try:
+        records, problems = compile_items(args.items_file)
+    except FileNotFoundError:
+        print(f"Error: The file '{args.items_file}' was not found.")
+        sys.exit(1)
+
+    if problems:
+        print(f"Found {len(problems)} problems in {args.items_file}:")
+        for problem in problems:
+            print(f"- {problem}")
+        sys.exit(1)
+    print(f"All {len(records)} items in {args.items_file} are valid")
+    if args.check:
+        return
+
+    item_bank.write_bank(args.output, records, args.items_file)
+    domains = len({record['item']['domain'] for record in records})
+    modules = len({record['item']['module'] for record in records})
+    print(f"Compiled {len(records)} items ({modules} modules, {domains} domains) into {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Compiled item bank.
+A SQLite copy of items.jsonl (built by compile_items.py) in which every item
+is stored with its prompt and answer schema already rendered, and indexed by
+task_id, domain, module, difficulty and tags, so the runner can load just the
+items it needs without parsing and re-templating the whole file.
+"""
+
+import json
+import os
+import sqlite3
+import zlib
+
+# Default location of the compiled bank
+ITEM_BANK = "items.sqlite"
+
+# Bumped when the table layout changes; older banks must be recompiled
+BANK_VERSION = 1
+
+SCHEMA = [
+    "CREATE TABLE items ("
+    "position INTEGER PRIMARY KEY, task_id TEXT NOT NULL UNIQUE, module TEXT, domain TEXT, "
+    "difficulty INTEGER, shard_key INTEGER NOT NULL, item TEXT NOT NULL, prompt TEXT NOT NULL, "
+    "question_text TEXT NOT NULL, schema_hint TEXT NOT NULL, answer_schema TEXT NOT NULL)",
+    "CREATE TABLE item_tags (tag TEXT NOT NULL, task_id TEXT NOT NULL, "
+    "PRIMARY KEY (tag, task_id)) WITHOUT ROWID",
+    "CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE INDEX idx_items_domain ON items (domain)",
+    "CREATE INDEX idx_items_module ON items (module)",
+    "CREATE INDEX idx_items_difficulty ON items (difficulty)",
+]
+
+def shard_key(task_id):
+    """Stable hash of a task_id that assigns it to a shard (see --shard)."""
+    return zlib.crc32(task_id.encode('utf-8'))
+
+def in_shard(task_id, shard):
+    """Whether an item belongs to ``shard``, a (number, count) pair with number from 1."""
+    number, count = shard
+    return shard_key(task_id) % count == number - 1
+
+def source_signature(items_file):
+    """Size and modification time of the items file, to tell when a bank is out of date."""
+    stat = os.stat(items_file)
+    return {'source_size': str(stat.st_size), 'source_mtime_ns': str(stat.st_mtime_ns)}
+
+def write_bank(path, records, items_file):
+    """Write compiled items to a new bank at ``path``, replacing any old one.
+
+    ``records`` are dicts holding the item and its rendered 'prompt',
+    'question_text', 'schema_hint' and 'answer_schema'. The bank is built in
+    a temporary file and moved into place, so readers never see half a bank.
+    """
+    temp_path = path + '.tmp'
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    conn = sqlite3.connect(temp_path)
+    try:
+        for statement in SCHEMA:
+            conn.execute(statement)
+        for position, record in enumerate(records):
+            item = record['item']
+            conn.execute(
+                "INSERT INTO items (position, task_id, module, domain, difficulty, shard_key, item, "
+                "prompt, question_text, schema_hint, answer_schema) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (position, item['task_id'], item.get('module'), item.get('domain'),
+                 item.get('difficulty'), shard_key(item['task_id']), json.dumps(item),
+                 record['prompt'], record['question_text'], record['schema_hint'],
+                 json.dumps(record['answer_schema']))
+            )
+            conn.executemany("INSERT OR IGNORE INTO item_tags (tag, task_id) VALUES (?, ?)",
+                             [(tag, item['task_id']) for tag in item.get('tags') or []])
+        meta = dict(source_signature(items_file), version=str(BANK_VERSION),
+                    source=os.path.abspath(items_file), items=str(len(records)))
+        conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", meta.items())
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(temp_path, path)
+
+def read_meta(path):
+    """The bank's metadata (version, source file signature, item count)."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return dict(conn.execute("SELECT key, value FROM meta").fetchall())
+    finally:
+        conn.close()
+
+def is_current(path, items_file):
+    """Whether the bank at ``path`` was compiled from ``items_file`` as it is now."""
+    try:
+        meta = read_meta(path)
+    except sqlite3.Error:
+        return False
+    if meta.get('version') != str(BANK_VERSION):
+        return False
+    if not os.path.exists(items_file):
+        return True
+    return all(meta.get(key) == value for key, value in source_signature(items_file).items())
+
+def read_items(path, domains=None, modules=None, difficulties=None, tags=None, task_ids=None,
+               shard=None):
+    """Load the items matching every given filter, in items.jsonl order.
+
+    ``domains``, ``modules``, ``difficulties`` and ``task_ids`` keep items
+    whose field is in the list, ``tags`` items with any of the tags, and
+    ``shard`` (number, count) one of ``count`` disjoint slices. The filters
+    run in SQLite, so only matching rows are read and parsed. Each item
+    carries its rendered prompt and schema under 'compiled'.
+    """
+    conditions = []
+    params = []
+    for column, values in (('domain', domains), ('module', modules),
+                           ('difficulty', difficulties), ('task_id', task_ids)):
+        if values:
+            conditions.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+    if tags:
+        conditions.append(f"task_id IN (SELECT task_id FROM item_tags WHERE tag IN "
+                          f"({', '.join('?' * len(tags))}))")
+        params.extend(tags)
+    if shard:
+        conditions.append("shard_key % ? = ?")
+        params.extend([shard[1], shard[0] - 1])
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT item, prompt, question_text, schema_hint, answer_schema FROM items"
+            f"{where} ORDER BY position", params
+        ).fetchall()
+    finally:
+        conn.close()
+
+    items = []
+    for item, prompt, question_text, schema_hint, answer_schema in rows:
+        item = json.loads(item)
+        item['compiled'] = {
+            'prompt': prompt,
+            'question_text': question_text,
+            'schema_hint': schema_hint,
+            'answer_schema': json.loads(answer_schema),
+        }
+        items.append(item)
+    return items
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Load test for the benchmark harness.
+Generates synthetic items, serves scripted answers for them from
+mock_server.py and runs the runner against it, reporting throughput,
+harness overhead per item and behaviour under failures. No model, GPU or
+API key is needed.
+"""
+
+import argparse
+import contextlib
+import csv
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+import run_benchmark
+
+# Scenarios: mock server behaviour plus runner options
+SCENARIOS = {
+    'overhead': {
+        'description': 'No model latency: the harness cost per item',
+        'latency': '0',
+    },
+    'latency': {
+        'description': 'Realistic reply times (lognormal, median 50 ms)',
+        'latency': 'lognormal:0.05:0.5',
+    },
+    'streaming': {
+        'description': 'Streamed replies with trailing chatter, closed early',
+        'latency': 'lognormal:0.05:0.5', 'ttft': '0.01', 'chatter': 600, 'stream': True,
+    },
+    'packed': {
+        'description': 'Eight items per request',
+        'latency': 'lognormal:0.05:0.5', 'pack': 8,
+    },
+    'native': {
+        'description': "Ollama's native /api/chat, model preloaded (0.5 s load)",
+        'latency': 'lognormal:0.05:0.5', 'native': True, 'load_time': '0.5',
+    },
+    'failures': {
+        'description': '5% HTTP 500 and 5% HTTP 429 (Retry-After 0.1 s)',
+        'latency': 'lognormal:0.05:0.5', 'error_rate': 0.05, 'rate_limit_rate': 0.05,
+        'retry_after': 0.1,
+    },
+}
+
+# Share of synthetic items that are structured (numeric answer) rather than multiple choice
+STRUCTURED_SHARE = 0.1
+SYNTHETIC_DOMAINS = 12
+
+# Model name recorded for load-test rows
+MOCK_MODEL = 'mock-model'
+
+def generate_items(path, count, seed=0):
+    """Write ``count`` synthetic items to ``path`` and return them."""
+    rng = random.Random(seed)
+    items = []
+    for i in range(count):
+        item = {
+            'task_id': f"SYN-{i:06d}",
+            'module': 'Synthetic',
+            'domain': f"Synthetic Domain {i % SYNTHETIC_DOMAINS}",
+        }
+        if rng.random() < STRUCTURED_SHARE:
+            item.update({
+                'prompt': f"Synthetic question {i}: how many observations does dataset {i} have?",
+                'answer_type': 'structured_single',
+                'output_schema': {'type': 'object', 'properties': {'count': {'type': 'integer'}},
+                                  'required': ['count']},
+                'scoring': {'method': 'numeric_match', 'expected_value': rng.randint(1, 10000)},
+            })
+        else:
+            item.update({
+                'prompt': f"Synthetic question {i}: which command applies to case {i}?",
+                'choices': [f"command{i}_{k}" for k in range(4)],
+                'correct_index': rng.randrange(4),
+                'answer_type': 'multiple_choice',
+                'scoring': {'method': 'choice_equals_index'},
+            })
+        items.append(item)
+    with open(path, 'w') as f:
+        for item in items:
+            f.write(json.dumps(item) + "\n")
+    return items
+
+def free_port():
+    """A TCP port that is free right now."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+@contextlib.contextmanager
+def mock_server(items_file, scenario, seed=0):
+    """Run mock_server.py for a scenario in a subprocess; yields its base URL."""
+    port = free_port()
+    command = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_server.py'),
+        '--port', str(port), '--items_file', items_file, '--seed', str(seed),
+        '--latency', scenario.get('latency', '0'), '--ttft', scenario.get('ttft', '0'),
+        '--error_rate', str(scenario.get('error_rate', 0.0)),
+        '--rate_limit_rate', str(scenario.get('rate_limit_rate', 0.0)),
+        '--retry_after', str(scenario.get('retry_after', 1.0)),
+        '--chatter', str(scenario.get('chatter', 0)),
+        '--load_time', scenario.get('load_time', '0'),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                requests.get(base_url, timeout=1)
+                break
+            except requests.exceptions.ConnectionError:
+                if time.monotonic() > deadline or process.poll() is not None:
+                    raise RuntimeError("Mock server did not start")
+                time.sleep(0.1)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait()
+
+def percentile(values, p):
+    """The p-th percentile of a list of numbers (nearest rank)."""
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+def summarize_rows(output_file, elapsed, concurrency):
+    """Throughput, overhead and failure figures from a run's result rows."""
+    with open(output_file, 'r', newline='') as csvfile:
+        rows = list(csv.DictReader(csvfile))
+    latencies = [float(row['latency_s']) for row in rows if row['latency_s']]
+    # A packed request's latency is shared by its items
+    request_time = sum(float(row['latency_s']) / int(row['pack_size'] or 1)
+                       for row in rows if row['latency_s'])
+    return {
+        'items': len(rows),
+        'elapsed_s': round(elapsed, 3),
+        'items_per_s': round(len(rows) / elapsed, 1),
+        # Worker time per item not spent waiting on a request
+        'overhead_ms': round((elapsed * concurrency - request_time) / len(rows) * 1000, 3),
+        'latency_p50_s': round(percentile(latencies, 50), 4),
+        'latency_p99_s': round(percentile(latencies, 99), 4),
+        'correct': sum(row['result'] == 'Correct' for row in rows),
+        'errors': sum(row['result'] == 'Error' for row in rows),
+        'retries': sum(int(row['retries'] or 0) for row in rows),
+    }
+
+def run_scenario(name, scenario, items, items_file, work_dir, concurrency):
+    """Run every item through the runner against a mock server; return its figures."""
+    output_file = os.path.join(work_dir, f"{name}.csv")
+    run_benchmark.write_csv_header(output_file)
+    run_benchmark.configure_clients(pool_size=concurrency)
+    run_benchmark.configure_requests(stream=scenario.get('stream', False), structured=False,
+                                     pack_size=scenario.get('pack', 1))
+    run_benchmark.configure_ollama(native=scenario.get('native', False))
+    run_benchmark.OLLAMA_MAX_CONCURRENCY = concurrency
+    run_benchmark.reset_backend_limits()
+
+    with mock_server(items_file, scenario) as base_url:
+        run_benchmark.BASE_URL = base_url
+        run_benchmark.API_URL = f"{base_url}/v1/chat/completions"
+        writer = run_benchmark.ResultsWriter(output_file=output_file)
+        if scenario.get('native'):
+            # Load the model before timing starts, as run_model() does
+            run_benchmark.preload_model(MOCK_MODEL)
+        started = time.perf_counter()
+        try:
+            # The runner prints a line per item; keep it out of the report
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                run_benchmark.run_benchmark(items, MOCK_MODEL, 0.0, None, writer,
+                                            concurrency=concurrency)
+                writer.close()
+        finally:
+            run_benchmark.close_clients()
+        elapsed = time.perf_counter() - started
+    return summarize_rows(output_file, elapsed, concurrency)
+
+def compare_reports(report, baseline, tolerance):
+    """Scenarios whose throughput fell more than ``tolerance`` below the baseline."""
+    regressions = []
+    for name, figures in report.items():
+        previous = baseline.get(name)
+        if previous and figures['items_per_s'] < previous['items_per_s'] * (1 - tolerance):
+            regressions.append(f"{name}: {figures['items_per_s']} items/s "
+                               f"(baseline {previous['items_per_s']})")
+    return regressions
+
+def main():
+    """Main function to load-test the benchmark harness."""
+    parser = argparse.ArgumentParser(description='Load-test the benchmark harness against a mock server')
+    parser.add_argument('--items', type=int, default=10000, help='Synthetic items per scenario (default: 10000)')
+    parser.add_argument('--concurrency', type=int, default=32,
+                       help='Requests in flight at once (default: 32)')
+    parser.add_argument('--scenarios', type=str, default=','.join(SCENARIOS),
+                       help=f'Comma-separated scenarios to run (default: all of {", ".join(SCENARIOS)})')
+    parser.add_argument('--report', type=str, metavar='PATH', help='Write the figures as JSON')
+    parser.add_argument('--compare', type=str, metavar='PATH',
+                       help='JSON report from an earlier run; exit 1 if throughput regressed')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                       help='Allowed throughput drop against --compare (default: 0.2)')
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    report = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        items_file = os.path.join(work_dir, 'items.jsonl')
+        items = generate_items(items_file, args.items)
+        print(f"--- Harness Load Test: {args.items} items, concurrency {args.concurrency} ---")
+        for name in names:
+            print(f"\n{name}: {SCENARIOS[name]['description']}")
+            figures = run_scenario(name, SCENARIOS[name], items, items_file, work_dir,
+                                   args.concurrency)
+            report[name] = figures
+            print(f"  {figures['items_per_s']:>8} items/s   {figures['overhead_ms']:>7} ms overhead/item   "
+                  f"latency p50 {figures['latency_p50_s']} s, p99 {figures['latency_p99_s']} s")
+            print(f"  {figures['correct']}/{figures['items']} correct, {figures['errors']} errors, "
+                  f"{figures['retries']} retries, {figures['elapsed_s']} s")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport saved to: {args.report}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            regressions = compare_reports(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nThroughput regressions:")
+            for regression in regressions:
+                print(f"- {regression}")
+            sys.exit(1)
+        print(f"\nNo throughput regressions against {args.compare}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Mock chat server for testing the benchmark harness.
+Serves the OpenAI-compatible chat completions endpoint that the runner uses
+for Ollama and cloud models, and Ollama's native /api/chat, answering with
+scripted answers for the items in items.jsonl. Latency, errors, rate
+limiting, streaming and model loading behave as configured, so the runner
+can be exercised without a GPU or API budget.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Characters per streamed chunk, and per token when counting usage
+STREAM_CHUNK_CHARS = 4
+CHARS_PER_TOKEN = 4
+
+# How long a model stays loaded when a native request gives no keep_alive (Ollama's default)
+DEFAULT_KEEP_ALIVE = '5m'
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+def parse_latency(spec):
+    """Turn a latency spec into a function returning seconds.
+
+    Specs: "0.2" or "fixed:0.2", "uniform:LOW:HIGH",
+    "lognormal:MEDIAN:SIGMA" and "exponential:MEAN".
+    """
+    kind, _, params = spec.partition(':')
+    if not params:
+        kind, params = 'fixed', kind
+    values = [float(value) for value in params.split(':')]
+    if kind == 'fixed':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        median, sigma = values
+        return lambda: random.lognormvariate(0, sigma) * median
+    if kind == 'exponential':
+        return lambda: random.expovariate(1 / values[0]) if values[0] > 0 else 0.0
+    raise ValueError(f"Unknown latency distribution: {kind}")
+
+def parse_keep_alive(value):
+    """Seconds from an Ollama keep_alive (number of seconds or "10m"-style); negative means forever."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.fullmatch(r'(-?[\d.]+)(ms|s|m|h)?', str(value).strip())
+    if not match:
+        raise ValueError(f"Invalid keep_alive: {value}")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2) or 's']
+
+def load_items(items_file):
+    """Index items by their question text and by task_id."""
+    by_prompt = {}
+    by_task_id = {}
+    with open(items_file, 'r') as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                by_prompt[item['prompt']] = item
+                by_task_id[item['task_id']] = item
+    return by_prompt, by_task_id
+
+def scripted_answer(item, correct):
+    """The answer fields for an item, right or deliberately wrong."""
+    if item['answer_type'] == 'multiple_choice':
+        index = item['correct_index'] if correct else (item['correct_index'] + 1) % len(item['choices'])
+        return {'choice': index}
+    key = next(iter(item['output_schema']['properties']))
+    scoring = item.get('scoring', {})
+    if scoring.get('method') == 'numeric_match':
+        expected = scoring.get('expected_value')
+        if correct:
+            return {key: expected}
+        return {key: expected + 1 if isinstance(expected, (int, float)) else 'unknown'}
+    phrases = scoring.get('accepted_phrases') or ['']
+    return {key: phrases[0] if correct else 'I am not sure'}
+
+class MockChatServer(ThreadingHTTPServer):
+    """HTTP server holding the mock's items and behaviour settings."""
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, items_file, latency='0', ttft='0', error_rate=0.0,
+                 rate_limit_rate=0.0, retry_after=1.0, accuracy=1.0, chatter=0, load_time='0'):
+        super().__init__(address, MockChatHandler)
+        self.items_by_prompt, self.items_by_task_id = load_items(items_file)
+        self.latency = parse_latency(latency)
+        self.ttft = parse_latency(ttft)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.accuracy = accuracy
+        self.chatter = chatter
+        self.load_time = parse_latency(load_time)
+        self.requests_served = 0
+        self.loads = 0
+        # Model name -> monotonic time it unloads (None: never), for native requests
+        self.loaded = {}
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def ensure_loaded(self, model, keep_alive):
+        """Load ``model`` if it is not resident; return the seconds spent loading.
+
+        Loads happen one at a time, as in Ollama. ``keep_alive`` sets how
+        long the model stays loaded after this request.
+        """
+        with self._load_lock:
+            unloads_at = self.loaded.get(model, 0)
+            load_s = 0.0
+            if unloads_at is not None and unloads_at <= time.monotonic():
+                load_s = self.load_time()
+                time.sleep(load_s)
+                with self._lock:
+                    self.loads += 1
+            duration = parse_keep_alive(keep_alive)
+            self.loaded[model] = None if duration < 0 else time.monotonic() + duration
+            return load_s
+
+    def find_item(self, prompt):
+        """The item a single-item prompt asks about, or None."""
+        question = re.split(r'\n\n(?:Choices:|Answer with JSON)', prompt, maxsplit=1)[0]
+        return self.items_by_prompt.get(question)
+
+    def answer(self, prompt):
+        """Scripted reply content for a prompt (packed or single)."""
+        task_ids = re.findall(r'^### Question (\S+)$', prompt, flags=re.MULTILINE)
+        if task_ids:
+            answers = [
+                dict(task_id=task_id, **scripted_answer(item, random.random() < self.accuracy))
+                for task_id in task_ids
+                for item in [self.items_by_task_id.get(task_id)] if item is not None
+            ]
+            content = json.dumps({'answers': answers})
+        else:
+            item = self.find_item(prompt)
+            fields = scripted_answer(item, random.random() < self.accuracy) if item else {'choice': 0}
+            content = json.dumps(fields)
+        if self.chatter:
+            content += "\n\nExplanation: " + "lorem ipsum " * (self.chatter // 3)
+        return content
+
+class MockChatHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this, Nagle's
+    # algorithm and delayed ACKs hold each keep-alive reply back ~40 ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/':
+            data = b'Ollama is running'
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self.send_json(404, {'error': f'not found: {self.path}'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            body = json.loads(self.rfile.read(length))
+        except json.JSONDecodeError:
+            self.send_json(400, {'error': {'message': 'invalid JSON body'}})
+            return
+        if self.path == '/v1/chat/completions':
+            self.chat_completions(body)
+        elif self.path == '/api/chat':
+            self.native_chat(body)
+        else:
+            self.send_json(404, {'error': f'not found: {self.path}'})
+
+    def chat_completions(self, body):
+        server = self.server
+        with server._lock:
+            server.requests_served += 1
+
+        roll = random.random()
+        if roll < server.rate_limit_rate:
+            headers = {'Retry-After': str(server.retry_after)} if server.retry_after >= 0 else {}
+            self.send_json(429, {'error': {'message': 'Rate limit exceeded', 'type': 'rate_limit'}},
+                           headers)
+            return
+        if roll < server.rate_limit_rate + server.error_rate:
+            self.send_json(500, {'error': {'message': 'Internal server error', 'type': 'server_error'}})
+            return
+
+        prompt = body['messages'][-1]['content']
+        # Streams carry one completion; 'n' applies to plain replies
+        samples = 1 if body.get('stream') else max(1, int(body.get('n') or 1))
+        contents = [server.answer(prompt) for _ in range(samples)]
+        content = contents[0]
+        usage = {
+            'prompt_tokens': sum(len(m['content']) for m in body['messages']) // CHARS_PER_TOKEN,
+            'completion_tokens': sum(len(text) // CHARS_PER_TOKEN + 1 for text in contents),
+        }
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        completion_id = f"chatcmpl-mock-{server.requests_served}"
+        model = body.get('model', 'mock')
+
+        if not body.get('stream'):
+            time.sleep(server.latency())
+            self.send_json(200, {
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': index, 'message': {'role': 'assistant', 'content': text},
+                             'finish_reason': 'stop'} for index, text in enumerate(contents)],
+                'usage': usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        chunks = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+        first_token = server.ttft()
+        per_chunk = max(0.0, server.latency() - first_token) / max(1, len(chunks))
+
+        def event(delta, finish_reason=None, **extra):
+            return dict({
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+            }, **extra)
+
+        try:
+            time.sleep(first_token)
+            self.send_event(event({'role': 'assistant', 'content': ''}))
+            for chunk in chunks:
+                self.send_event(event({'content': chunk}))
+                if per_chunk:
+                    time.sleep(per_chunk)
+            self.send_event(event({}, 'stop'))
+            if (body.get('stream_options') or {}).get('include_usage'):
+                self.send_event(dict(event({}), choices=[], usage=usage))
+            self.wfile.write(b'data: [DONE]\n\n')
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream early (e.g. the runner's --stream)
+            pass
+
+    def send_event(self, data):
+        self.wfile.write(f"data: {json.dumps(data)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    def native_chat(self, body):
+        """Ollama's /api/chat: a JSON reply, or newline-delimited JSON when streaming."""
+        server = self.server
+        with server._lock:
+            server.requests_served += 1
+        if random.random() < server.error_rate:
+            self.send_json(500, {'error': 'Internal server error'})
+            return
+
+        started = time.monotonic()
+        model = body.get('model', 'mock')
+        try:
+            load_s = server.ensure_loaded(model, body.get('keep_alive', DEFAULT_KEEP_ALIVE))
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        content = server.answer(body['messages'][-1]['content'])
+        num_predict = (body.get('options') or {}).get('num_predict')
+        if num_predict and num_predict > 0:
+            content = content[:num_predict * CHARS_PER_TOKEN]
+
+        def final(**extra):
+            return dict({
+                'model': model,
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'done': True,
+                'done_reason': 'stop',
+                'total_duration': int((time.monotonic() - started) * 1e9),
+                'load_duration': int(load_s * 1e9),
+                'prompt_eval_count': sum(len(m['content']) for m in body['messages']) // CHARS_PER_TOKEN,
+                'eval_count': len(content) // CHARS_PER_TOKEN + 1,
+            }, **extra)
+
+        if not body.get('stream', True):
+            time.sleep(server.latency())
+            self.send_json(200, final(message={'role': 'assistant', 'content': content}))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        chunks = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+        first_token = server.ttft()
+        per_chunk = max(0.0, server.latency() - first_token) / max(1, len(chunks))
+        try:
+            time.sleep(first_token)
+            for chunk in chunks:
+                self.send_line({'model': model, 'message': {'role': 'assistant', 'content': chunk},
+                                'done': False})
+                if per_chunk:
+                    time.sleep(per_chunk)
+            self.send_line(final(message={'role': 'assistant', 'content': ''}))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def send_line(self, data):
+        self.wfile.write(json.dumps(data).encode('utf-8') + b'\n')
+        self.wfile.flush()
+
+def main():
+    """Run the mock server until interrupted."""
+    parser = argparse.ArgumentParser(description='Mock OpenAI/Ollama-compatible chat server')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=11434, help='Port to listen on (default: 11434, as Ollama)')
+    parser.add_argument('--items_file', type=str, default='items.jsonl', help='Items to script answers for')
+    parser.add_argument('--latency', type=str, default='0',
+                       help='Time per reply: "0.2", "uniform:0.1:0.5", "lognormal:MEDIAN:SIGMA", "exponential:MEAN"')
+    parser.add_argument('--ttft', type=str, default='0', help='Time to first token when streaming (same forms)')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 500')
+    parser.add_argument('--rate_limit_rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 429')
+    parser.add_argument('--retry_after', type=float, default=1.0,
+                       help='Retry-After seconds sent with 429s (negative to omit the header)')
+    parser.add_argument('--accuracy', type=float, default=1.0, help='Probability that an answer is correct')
+    parser.add_argument('--chatter', type=int, default=0,
+                       help='Characters of explanation to add after the JSON answer')
+    parser.add_argument('--load_time', type=str, default='0',
+                       help='Time to load a model that is not resident, for native /api/chat requests (same forms)')
+    parser.add_argument('--seed', type=int, help='Random seed')
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    server = MockChatServer((args.host, args.port), args.items_file, latency=args.latency,
+                            ttft=args.ttft, error_rate=args.error_rate,
+                            rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+                            accuracy=args.accuracy, chatter=args.chatter, load_time=args.load_time)
+    print(f"Mock chat server on http://{args.host}:{args.port} "
+          f"({len(server.items_by_task_id)} items from {args.items_file})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
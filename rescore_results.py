@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Re-scoring script for benchmark results.
+Re-applies the scoring rules in items.jsonl to the answers stored in
+results.csv or the Parquet results store, without querying any model again.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+import pandas as pd
+
+import results_store
+from run_benchmark import ITEMS_FILE, CSV_FIELDNAMES, choice_index, parse_json_answer
+
+def load_scoring_rules(items_file=ITEMS_FILE):
+    """Load the scoring rules of every item as a DataFrame keyed by task_id."""
+    rows = []
+    with open(items_file, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            scoring = item.get('scoring', {})
+            rows.append({
+                'task_id': item['task_id'],
+                'method': scoring.get('method'),
+                'correct_index': item.get('correct_index'),
+                'expected_value': scoring.get('expected_value'),
+                'accepted_phrases': scoring.get('accepted_phrases', [])
+            })
+    # object dtype keeps expected values as written (42, not 42.0)
+    return pd.DataFrame(rows, dtype=object)
+
+def parse_stored_answer(parsed_answer, raw_response):
+    """Recover a model's answer from the stored parsed JSON or raw reply.
+
+    Returns None when there is no usable answer, mirroring the cases that
+    score_response() marks as Incorrect.
+    """
+    try:
+        if parsed_answer:
+            answer = json.loads(parsed_answer)
+        elif raw_response:
+            answer = parse_json_answer(raw_response)
+        else:
+            return None
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(answer, dict) or not answer or "error" in answer:
+        return None
+    return answer
+
+def score_choice_equals_index(group):
+    """The 'choice' field equals the item's correct_index, compared as score_response() does."""
+    choice = group['choice'].map(choice_index)
+    expected = group['correct_index'].map(choice_index)
+    return choice.notna() & choice.eq(expected)
+
+def score_numeric_match(group):
+    """The first answer field, as text, equals the expected value."""
+    return group['first_value'].map(str).eq(group['expected_value'].map(str))
+
+def score_phrase_match(group):
+    """The first answer field contains one of the accepted phrases."""
+    text = group['first_value'].map(str).str.lower()
+    correct = pd.Series(False, index=group.index)
+    for _, rows in group.groupby('task_id'):
+        phrases = rows['accepted_phrases'].iloc[0]
+        if phrases:
+            pattern = '|'.join(re.escape(phrase.lower()) for phrase in phrases)
+            correct[rows.index] = text[rows.index].str.contains(pattern, regex=True)
+    return correct
+
+# Vectorized scorer for each scoring method: takes the rows of one method
+# and returns a boolean Series marking the correct answers
+SCORERS = {
+    'choice_equals_index': score_choice_equals_index,
+    'numeric_match': score_numeric_match,
+    'phrase_match': score_phrase_match,
+}
+
+def rescore(df, rules):
+    """Return the re-scored result for every row of ``df``.
+
+    Rows that failed in transport, and rows with no stored answer (written
+    before answers were recorded), keep their existing result.
+    """
+    merged = df[['task_id', 'result', 'parsed_answer', 'raw_response']].merge(
+        rules, on='task_id', how='left'
+    )
+    merged.index = df.index
+
+    answers = pd.Series(
+        [parse_stored_answer(parsed, raw)
+         for parsed, raw in zip(merged['parsed_answer'], merged['raw_response'])],
+        index=merged.index, dtype=object
+    )
+    merged['choice'] = [answer.get('choice') if answer else None for answer in answers]
+    merged['first_value'] = [next(iter(answer.values())) if answer else None for answer in answers]
+
+    has_output = merged['parsed_answer'].ne('') | merged['raw_response'].ne('')
+    rescorable = has_output & merged['method'].notna() & merged['result'].ne('Error')
+
+    results = df['result'].copy()
+    results[rescorable] = 'Incorrect'
+    answered = merged[rescorable & answers.notna()]
+    for method, group in answered.groupby('method'):
+        scorer = SCORERS.get(method)
+        if scorer is None:
+            results[group.index] = 'Scoring Error'
+            continue
+        correct = scorer(group)
+        results[correct[correct].index] = 'Correct'
+    return results
+
+def load_store_results(store_dir):
+    """Read every row of a Parquet results store, as text like the CSV.
+
+    Each row's 'store_file' names the file it came from, so changed
+    verdicts can be written back file by file.
+    """
+    frames = [results_store.read_table(store_dir, files=[name]).to_pandas().assign(store_file=name)
+              for name in results_store.data_files(store_dir)]
+    if not frames:
+        return pd.DataFrame(columns=CSV_FIELDNAMES + ['store_file'])
+    df = pd.concat(frames, ignore_index=True).astype(object)
+    return df.where(df.notna(), '').astype(str)
+
+def save_store_results(store_dir, df, new_results):
+    """Rewrite the store files holding changed verdicts; returns how many were rewritten."""
+    changed_files = df.loc[new_results.ne(df['result']), 'store_file'].unique()
+    for name in changed_files:
+        rows = df['store_file'].eq(name)
+        results_store.replace_column(store_dir, name, 'result', new_results[rows].tolist())
+    return len(changed_files)
+
+def main():
+    """Main function to re-score stored benchmark answers."""
+    parser = argparse.ArgumentParser(description='Re-score stored benchmark answers')
+    parser.add_argument('--input', type=str, default='results/results.csv', help='Results CSV, or Parquet results store directory, to re-score')
+    parser.add_argument('--output', type=str, help='Where to write the re-scored CSV (default: overwrite --input; '
+                            'a Parquet store is always updated in place)')
+    parser.add_argument('--items_file', type=str, default=ITEMS_FILE, help='Item bank with the scoring rules')
+    parser.add_argument('--dry_run', action='store_true', help='Report changes without writing anything')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        print(f"Error: {args.input} not found. Run benchmark tests first.")
+        sys.exit(1)
+
+    is_store = os.path.isdir(args.input)
+    if is_store:
+        if results_store.pa is None:
+            print("Error: pyarrow is required to re-score a Parquet results store. Run: pip install pyarrow")
+            sys.exit(1)
+        if args.output:
+            print("Error: --output applies to CSV files only; a Parquet store is re-scored in place.")
+            sys.exit(1)
+        df = load_store_results(args.input)
+    else:
+        df = pd.read_csv(args.input, dtype=str, keep_default_na=False)
+    for column in CSV_FIELDNAMES:
+        if column not in df.columns:
+            df[column] = ''
+    rules = load_scoring_rules(args.items_file)
+    print(f"Loaded {len(df)} results from {args.input}")
+
+    new_results = rescore(df, rules)
+    changed = new_results.ne(df['result'])
+
+    print(f"\nRe-scored {len(df)} rows: {changed.sum()} verdicts changed")
+    if changed.any():
+        summary = df[changed].assign(new_result=new_results[changed]).groupby(
+            ['model_name', 'temperature', 'result', 'new_result']
+        ).size()
+        for (model, temp, old, new), count in summary.items():
+            print(f"{model} (T={temp}): {old} -> {new}: {count}")
+
+    if args.dry_run:
+        return
+
+    if is_store:
+        count = save_store_results(args.input, df, new_results)
+        print(f"Rewrote {count} files in {args.input}")
+        return
+
+    df['result'] = new_results
+    output_file = args.output or args.input
+    temp_file = output_file + '.tmp'
+    columns = CSV_FIELDNAMES + [column for column in df.columns if column not in CSV_FIELDNAMES]
+    df[columns].to_csv(temp_file, index=False)
+    os.replace(temp_file, output_file)
+    print(f"Results saved to: {output_file}")
+
+if __name__ == "__main__":
+    main()
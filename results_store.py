@@ -0,0 +1,180 @@
+"""
+Partitioned Parquet store for benchmark results.
+Rows are written as Parquet files under hive-style model_name=/temperature=
+directories, so readers can load only the partitions and columns they need.
+"""
+
+import os
+import shutil
+import uuid
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    ds = None
+    pq = None
+
+# Default location of the store
+RESULTS_STORE = "results/store"
+
+# Columns of a result row, in the order they are written and exported
+RESULT_COLUMNS = ['timestamp', 'model_name', 'temperature', 'task_id', 'domain', 'result',
+                  'ttft_s', 'answer_s', 'latency_s', 'load_s', 'prompt_tokens', 'completion_tokens',
+                  'http_status', 'retries', 'pack_size', 'sample_index', 'parsed_answer',
+                  'raw_response']
+
+# Non-string columns; every other column is stored as a string
+COLUMN_TYPES = {
+    'temperature': 'float64',
+    'ttft_s': 'float64',
+    'answer_s': 'float64',
+    'latency_s': 'float64',
+    'load_s': 'float64',
+    'prompt_tokens': 'int64',
+    'completion_tokens': 'int64',
+    'http_status': 'int64',
+    'retries': 'int64',
+    'pack_size': 'int64',
+    'sample_index': 'int64',
+}
+
+def scan_csv_records(data, quoted=False):
+    """Find where the complete records end in a chunk of a results CSV.
+
+    ``data`` is bytes that start at a record boundary, or continue a chunk
+    that ended inside a quoted field if ``quoted`` is True. Stored replies
+    may contain newlines inside quotes, so a record ends only at a newline
+    outside quotes. Returns the offset just past the last complete record
+    (0 if none) and whether ``data`` ends inside a quoted field.
+    """
+    end = 0
+    position = 0
+    lines = data.split(b'\n')
+    for line in lines[:-1]:
+        position += len(line) + 1
+        # Escaped quotes come in pairs, so only an odd count changes the state
+        if line.count(b'"') % 2:
+            quoted = not quoted
+        if not quoted:
+            end = position
+    if lines[-1].count(b'"') % 2:
+        quoted = not quoted
+    return end, quoted
+
+def require_pyarrow():
+    """Raise ImportError with install instructions if pyarrow is missing."""
+    if pa is None:
+        raise ImportError("pyarrow is required for the Parquet results store. Run: pip install pyarrow")
+
+def partitioning():
+    """Hive partitioning by model_name and temperature."""
+    return ds.partitioning(
+        pa.schema([('model_name', pa.string()), ('temperature', pa.float64())]),
+        flavor='hive'
+    )
+
+def arrow_schema(columns):
+    """Arrow schema for the given result columns."""
+    return pa.schema([(column, pa.type_for_alias(COLUMN_TYPES.get(column, 'string')))
+                      for column in columns])
+
+def _convert(column, value):
+    """Convert a CSV-style value ('' for missing) to its stored type."""
+    if value is None or value == '':
+        return None
+    column_type = COLUMN_TYPES.get(column)
+    if column_type == 'float64':
+        return float(value)
+    if column_type == 'int64':
+        return int(value)
+    return str(value)
+
+def write_rows(store_dir, rows, columns=RESULT_COLUMNS):
+    """Write result rows (dicts) as new Parquet files in the store.
+
+    Files are first written to a staging directory inside the store (which
+    readers ignore because of its leading underscore) and then moved into
+    their partitions, so readers never see a partially written file.
+    """
+    require_pyarrow()
+    if not rows:
+        return
+    table = pa.Table.from_pylist(
+        [{column: _convert(column, row.get(column)) for column in columns} for row in rows],
+        schema=arrow_schema(columns)
+    )
+
+    batch_id = uuid.uuid4().hex
+    staging_dir = os.path.join(store_dir, f"_staging-{batch_id}")
+    ds.write_dataset(table, staging_dir, format='parquet', partitioning=partitioning(),
+                     basename_template=f"part-{batch_id}-{{i}}.parquet")
+    for root, _, files in os.walk(staging_dir):
+        target_dir = os.path.join(store_dir, os.path.relpath(root, staging_dir))
+        os.makedirs(target_dir, exist_ok=True)
+        for name in files:
+            os.replace(os.path.join(root, name), os.path.join(target_dir, name))
+    shutil.rmtree(staging_dir)
+
+def replace_column(store_dir, name, column, values):
+    """Rewrite one store file with new ``values`` for ``column``.
+
+    The new file is written next to the old one and moved over it, so the
+    swap is a single atomic rename and readers see either the old rows or
+    the new ones, never both.
+    """
+    require_pyarrow()
+    path = os.path.join(store_dir, name)
+    table = ds.dataset(path, format='parquet').to_table()
+    field = table.schema.field(column)
+    table = table.set_column(table.schema.get_field_index(column), field,
+                             pa.array(values, type=field.type))
+    temp_path = path + '.tmp'
+    pq.write_table(table, temp_path)
+    os.replace(temp_path, path)
+
+def data_files(store_dir):
+    """Sorted paths, relative to ``store_dir``, of the store's Parquet files.
+
+    Files are only added, or replaced whole by replace_column(), so a file
+    list with each file's inode and modification time tells a reader which
+    rows it has already seen.
+    """
+    files = []
+    for root, dirs, names in os.walk(store_dir):
+        dirs[:] = [name for name in dirs if not name.startswith(('_', '.'))]
+        files.extend(os.path.relpath(os.path.join(root, name), store_dir)
+                     for name in names if name.endswith('.parquet'))
+    return sorted(files)
+
+def read_table(store_dir, columns=None, models=None, temperatures=None, files=None):
+    """Read the store as an Arrow table.
+
+    Only the requested ``columns`` are read (all, in RESULT_COLUMNS order,
+    if None), and ``models``/``temperatures`` prune whole partitions before
+    any file is opened. ``files`` (from data_files()) limits the read to
+    those files.
+    """
+    require_pyarrow()
+    # An explicit schema reads files written before a column was added as nulls
+    schema = arrow_schema(RESULT_COLUMNS)
+    if files is None:
+        dataset = ds.dataset(store_dir, format='parquet', schema=schema,
+                             partitioning=partitioning())
+    else:
+        dataset = ds.dataset([os.path.join(store_dir, name) for name in files], format='parquet',
+                             schema=schema, partitioning=partitioning(),
+                             partition_base_dir=store_dir)
+    condition = None
+    if models:
+        condition = ds.field('model_name').isin(list(models))
+    if temperatures:
+        temperature_filter = ds.field('temperature').isin([float(t) for t in temperatures])
+        condition = temperature_filter if condition is None else condition & temperature_filter
+    if columns is None:
+        columns = RESULT_COLUMNS + [name for name in dataset.schema.names
+                                    if name not in RESULT_COLUMNS]
+    columns = [column for column in columns if column in dataset.schema.names]
+    return dataset.to_table(columns=columns, filter=condition)
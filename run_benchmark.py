@@ -3,13 +3,30 @@ import requests
 import time
 import argparse
 import csv
+import io
 from datetime import datetime
 import os
+import hashlib
+import math
+import random
+import sqlite3
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from statistics import NormalDist
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 try:
-    from openai import OpenAI
+    from openai import OpenAI, APIConnectionError, APIStatusError, InternalServerError, RateLimitError
 except ImportError:
     OpenAI = None
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+import item_bank
+import results_store
 
 # Load environment variables
 load_dotenv()
@@ -22,128 +39,926 @@ BASE_URL = "http://localhost:11434" # For checking server status
 # The name of your question file
 ITEMS_FILE = "items.jsonl"
 
+# Maximum number of in-flight requests to the local server. Raise this if
+# Ollama is started with OLLAMA_NUM_PARALLEL > 1 or spans several GPUs.
+OLLAMA_MAX_CONCURRENCY = 2
+
+# Talk to Ollama through its native API ({BASE_URL}/api/chat, --ollama_native)
+# instead of the OpenAI-compatible endpoint. This controls how long the model
+# stays loaded (keep_alive), its context size and generation limit (None
+# leaves Ollama's defaults), and preloads the model before timing starts;
+# loading a large model can take minutes, hence its own timeout (seconds)
+OLLAMA_NATIVE = False
+OLLAMA_KEEP_ALIVE = "30m"
+OLLAMA_NUM_CTX = None
+OLLAMA_NUM_PREDICT = None
+OLLAMA_PRELOAD = True
+OLLAMA_LOAD_TIMEOUT = 600
+
+# Keep-alive connections kept open per backend, and per-request timeout (seconds)
+HTTP_POOL_SIZE = 16
+REQUEST_TIMEOUT = 60
+
+# Retries for transient failures (connection errors, 429 and 5xx responses),
+# with exponential backoff and full jitter between attempts (seconds)
+MAX_RETRIES = 4
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+# Stream replies and stop reading once the answer JSON is complete (--stream)
+STREAM_RESPONSES = False
+
+# Constrain replies to each item's JSON schema (--structured), with max_tokens
+# sized from the schema: a base allowance plus a budget per answer field type.
+# A provider's 'response_format' says what it enforces: 'json_schema' (the
+# item's schema), 'json_object' (any JSON object) or, if unset, nothing
+STRUCTURED_OUTPUT = False
+STRUCTURED_BASE_TOKENS = 8
+STRUCTURED_FIELD_TOKENS = {'integer': 8, 'number': 16, 'boolean': 8, 'string': 96}
+
+# Items answered per request (--pack); 1 sends every item on its own
+PACK_SIZE = 1
+
+# Answers sampled per item (--samples). Providers marked 'multi_sample' return
+# them all from one request (the 'n' parameter); other backends, including
+# Ollama, get that many concurrent duplicate requests
+SAMPLES = 1
+
+# Adaptive evaluation (see EarlyStopping and --adaptive)
+ADAPTIVE_CONFIDENCE = 0.95
+ADAPTIVE_MIN_ITEMS = 30
+ADAPTIVE_CHECK_EVERY = 10
+ADAPTIVE_SEED = 0
+
+# System message sent with every prompt
+SYSTEM_MESSAGE = "Answer in JSON only. No extra text. Use the schema given."
+
+# On-disk response cache (see ResponseCache)
+CACHE_FILE = "cache/responses.sqlite"
+CACHE_MAX_ENTRIES = 100000
+CACHE_MAX_AGE_DAYS = 90
+
+# Columns of the results CSV (shared with the Parquet results store)
+CSV_FIELDNAMES = results_store.RESULT_COLUMNS
+
+# Buffered results writer (see ResultsWriter)
+RESULTS_FLUSH_ROWS = 200
+RESULTS_FLUSH_SECONDS = 5.0
+
 # Supported API providers
 API_PROVIDERS = {
     'openai': {
         'models': ['gpt-4', 'gpt-4-turbo', 'gpt-3.5-turbo'],
-        'env_key': 'OPENAI_API_KEY'
+        'env_key': 'OPENAI_API_KEY',
+        'max_concurrency': 8,
+        'requests_per_second': 8,
+        'multi_sample': True,
+        'response_format': 'json_schema'
     },
     'deepseek': {
         'models': ['deepseek-chat', 'deepseek-coder'],
         'env_key': 'DEEPSEEK_API_KEY',
-        'base_url': 'https://api.deepseek.com/v1'
+        'base_url': 'https://api.deepseek.com/v1',
+        'max_concurrency': 8,
+        'requests_per_second': 8,
+        'response_format': 'json_object'
     },
     'anthropic': {
         'models': ['claude-3-haiku', 'claude-3-sonnet', 'claude-3-opus'],
-        'env_key': 'ANTHROPIC_API_KEY'
+        'env_key': 'ANTHROPIC_API_KEY',
+        'max_concurrency': 4,
+        'requests_per_second': 2
     }
 }
 # --- End of Configuration ---
 
-def check_server_status():
-    """Checks if the local LLM server is running before starting."""
+# One semaphore per backend ('ollama' or an API_PROVIDERS key), shared by all worker threads
+_backend_semaphores = {}
+_backend_semaphores_lock = threading.Lock()
+
+# Token-bucket rate limiters, one per API provider
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+# Pooled HTTP clients, created on first use and reused for the whole run:
+# 'ollama' -> requests.Session, (provider, base_url) -> OpenAI client
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Response cache consulted by get_llm_response(); None disables caching
+_response_cache = None
+
+# Local servers sharing the run (see EndpointPool and --endpoints); None uses BASE_URL alone
+_endpoint_pool = None
+
+# Set on Ctrl-C so that runs in progress stop sending items (see run_sweep)
+_interrupted = threading.Event()
+
+def configure_clients(pool_size=None, timeout=None, max_retries=None):
+    """Set pool size, timeout and retries for requests made from now on."""
+    global HTTP_POOL_SIZE, REQUEST_TIMEOUT, MAX_RETRIES
+    if max_retries is not None:
+        MAX_RETRIES = max_retries
+    if pool_size is not None:
+        HTTP_POOL_SIZE = pool_size
+    if timeout is not None:
+        REQUEST_TIMEOUT = timeout
+
+def configure_requests(stream=None, structured=None, pack_size=None, samples=None):
+    """Set how model requests are made from now on."""
+    global STREAM_RESPONSES, STRUCTURED_OUTPUT, PACK_SIZE, SAMPLES
+    if pack_size is not None:
+        PACK_SIZE = pack_size
+    if samples is not None:
+        SAMPLES = samples
+    if stream is not None:
+        STREAM_RESPONSES = stream
+    if structured is not None:
+        STRUCTURED_OUTPUT = structured
+
+def configure_ollama(native=None, keep_alive=None, num_ctx=None, num_predict=None, preload=None):
+    """Set how the local Ollama server is used from now on."""
+    global OLLAMA_NATIVE, OLLAMA_KEEP_ALIVE, OLLAMA_NUM_CTX, OLLAMA_NUM_PREDICT, OLLAMA_PRELOAD
+    if native is not None:
+        OLLAMA_NATIVE = native
+    if keep_alive is not None:
+        OLLAMA_KEEP_ALIVE = keep_alive
+    if num_ctx is not None:
+        OLLAMA_NUM_CTX = num_ctx
+    if num_predict is not None:
+        OLLAMA_NUM_PREDICT = num_predict
+    if preload is not None:
+        OLLAMA_PRELOAD = preload
+
+def get_http_session():
+    """Return the shared keep-alive session used for the local server."""
+    with _clients_lock:
+        session = _clients.get('ollama')
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({"Content-Type": "application/json"})
+            _clients['ollama'] = session
+        return session
+
+def get_api_client(provider, base_url=None):
+    """Return the shared OpenAI-compatible client for a provider, or None."""
+    provider_config = API_PROVIDERS.get(provider, API_PROVIDERS['openai'])
+    base_url = base_url or provider_config.get('base_url')
+    key = (provider, base_url)
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None:
+            return client
+
+        api_key = os.getenv(provider_config['env_key'])
+        if not api_key:
+            print(f"Error: {provider_config['env_key']} not found in environment variables.")
+            print(f"Please add it to your .env file: {provider_config['env_key']}=your_key_here")
+            return None
+
+        # Retries are handled by call_with_retries() so they respect the rate limiter
+        client_kwargs = {'api_key': api_key, 'timeout': REQUEST_TIMEOUT, 'max_retries': 0}
+        if base_url:
+            client_kwargs['base_url'] = base_url
+        if httpx is not None:
+            client_kwargs['http_client'] = httpx.Client(
+                limits=httpx.Limits(max_connections=HTTP_POOL_SIZE,
+                                    max_keepalive_connections=HTTP_POOL_SIZE),
+                timeout=REQUEST_TIMEOUT
+            )
+        client = OpenAI(**client_kwargs)
+        _clients[key] = client
+        return client
+
+def close_clients():
+    """Close every pooled client and its open connections."""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+class ResponseCache:
+    """SQLite cache of parsed model answers, keyed by a hash of the request.
+
+    Entries older than ``max_age_days`` are dropped and the least recently
+    used entries are trimmed to ``max_entries`` when the cache is opened.
+    Requests with temperature > 0 bypass the cache unless ``cache_sampled``.
+    """
+
+    def __init__(self, path=CACHE_FILE, max_entries=CACHE_MAX_ENTRIES,
+                 max_age_days=CACHE_MAX_AGE_DAYS, cache_sampled=False):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.cache_sampled = cache_sampled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model_name TEXT, answer TEXT, "
+            "created REAL, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON responses (last_used)")
+        self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(model_name, temperature, system_message, prompt_text, **options):
+        """Hash the request payload into a cache key."""
+        payload = {
+            'model': model_name,
+            'temperature': float(temperature),
+            'system': system_message,
+            'prompt': prompt_text,
+        }
+        payload.update(options)
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    def accepts(self, temperature):
+        """Whether requests at this temperature may be served from the cache."""
+        return self.cache_sampled or float(temperature) <= 0
+
+    def get(self, key):
+        """Return the cached answer for ``key`` or None, counting hits and misses."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT answer FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key, model_name, answer):
+        """Store a parsed answer under ``key``."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model_name, answer, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model_name, json.dumps(answer), now, now)
+            )
+            self._conn.commit()
+
+    def evict(self):
+        """Drop expired entries, then trim to max_entries by least recent use."""
+        with self._lock:
+            if self.max_age_days is not None:
+                cutoff = time.time() - self.max_age_days * 86400
+                self._conn.execute("DELETE FROM responses WHERE created < ?", (cutoff,))
+            if self.max_entries is not None:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+            self._conn.commit()
+
+    def stats_line(self):
+        """One-line summary of cache hits and misses for this run."""
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0
+        return f"Response cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1%} hit rate)"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def configure_cache(cache):
+    """Install (or with None, remove) the process-wide response cache."""
+    global _response_cache
+    _response_cache = cache
+
+def open_response_cache(args):
+    """Open and install the response cache from command line options.
+
+    Returns the cache, or None when --no_cache was given.
+    """
+    if args.no_cache:
+        return None
+    cache = ResponseCache(args.cache_file, max_entries=args.cache_max_entries,
+                          max_age_days=args.cache_max_age_days,
+                          cache_sampled=args.cache_sampled)
+    configure_cache(cache)
+    return cache
+
+class TransientError(Exception):
+    """A request failure that is worth retrying (network, 429 or 5xx)."""
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class RateLimiter:
+    """Token bucket that adapts to a provider's rate limits.
+
+    Starts at ``rate`` requests per second. A 429 halves the rate (down to
+    ``min_rate``) and, when the server sends Retry-After, blocks every caller
+    until it has passed; each success then restores the rate additively.
+    """
+
+    def __init__(self, rate, burst=None, min_rate=0.1):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_rate_limited(self, retry_after=None):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+def get_rate_limiter(api_provider):
+    """Return the shared rate limiter for an API provider (None for local)."""
+    if not api_provider:
+        return None
+    with _rate_limiters_lock:
+        if api_provider not in _rate_limiters:
+            rate = API_PROVIDERS[api_provider].get('requests_per_second')
+            _rate_limiters[api_provider] = RateLimiter(rate) if rate else None
+        return _rate_limiters[api_provider]
+
+def parse_retry_after(headers):
+    """Seconds to wait from a Retry-After header, or None."""
+    value = headers.get('retry-after') if headers is not None else None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+def call_with_retries(send, limiter=None, max_retries=None, details=None):
+    """Call ``send()`` with rate limiting, retrying on TransientError.
+
+    Waits for Retry-After when the server gives one, otherwise for an
+    exponentially growing, fully jittered delay. The last TransientError is
+    re-raised once the retries are used up. The number of retries made is
+    written to ``details['retries']`` if given.
+    """
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+    for attempt in range(max_retries + 1):
+        if details is not None:
+            details['retries'] = attempt
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            result = send()
+        except TransientError as e:
+            if e.status_code == 429 and limiter is not None:
+                limiter.on_rate_limited(e.retry_after)
+            if attempt == max_retries:
+                raise
+            delay = e.retry_after
+            if delay is None:
+                delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+            time.sleep(delay)
+            continue
+        if limiter is not None:
+            limiter.on_success()
+        return result
+
+def transport_error(message):
+    """Answer recorded when a request never produced a model response."""
+    return {"error": message, "transport_error": True}
+
+def build_messages(prompt_text):
+    """Chat messages sent for a prompt."""
+    return [
+        {"role": "system", "content": SYSTEM_MESSAGE},
+        {"role": "user", "content": prompt_text}
+    ]
+
+def parse_json_answer(raw_response_text):
+    """Strip markdown fences from a model reply and parse it as JSON."""
+    cleaned_text = raw_response_text.strip()
+    if cleaned_text.startswith("```json"):
+        cleaned_text = cleaned_text[7:]
+    if cleaned_text.endswith("```"):
+        cleaned_text = cleaned_text[:-3]
+    return json.loads(cleaned_text.strip())
+
+def parse_sample_reply(raw_response_text):
+    """Parse one of several sampled replies; invalid JSON becomes an error answer."""
+    try:
+        return parse_json_answer(raw_response_text)
+    except json.JSONDecodeError:
+        return {"error": "Invalid JSON response from model"}
+
+def ollama_options(temperature=None, num_predict=None):
+    """Model options for a native Ollama request, leaving out unset ones."""
+    options = {
+        'temperature': temperature,
+        'num_ctx': OLLAMA_NUM_CTX,
+        'num_predict': num_predict or OLLAMA_NUM_PREDICT,
+    }
+    return {name: value for name, value in options.items() if value is not None}
+
+def preload_model(model_name, base_url=None):
+    """Load a model into Ollama and warm it up with a one-token reply.
+
+    Uses the run's keep_alive and num_ctx, so the timed requests find the
+    model resident with the same context size (Ollama reloads a model whose
+    num_ctx changes). ``base_url`` picks the server (default: BASE_URL).
+    Returns (load_s, warmup_s), or None if it failed.
+    """
+    payload = {
+        "model": model_name,
+        "messages": build_messages("Reply with {}"),
+        "format": "json",
+        "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": ollama_options(num_predict=1)
+    }
+    started = time.monotonic()
     try:
-        requests.get(BASE_URL, timeout=5)
-        print(f"Successfully connected to the server at {BASE_URL}")
+        response = get_http_session().post(f"{base_url or BASE_URL}/api/chat", json=payload,
+                                           timeout=max(REQUEST_TIMEOUT, OLLAMA_LOAD_TIMEOUT))
+        response.raise_for_status()
+        body = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Could not preload {model_name}: {e}")
+        return None
+    elapsed = time.monotonic() - started
+    load_s = body.get('load_duration', 0) / 1e9
+    return round(load_s, 3), round(max(0.0, elapsed - load_s), 3)
+
+def endpoint_is_up(base_url):
+    """Whether a local server answers at ``base_url``."""
+    try:
+        get_http_session().get(base_url, timeout=5)
         return True
     except requests.exceptions.RequestException:
-        print(f"--- Connection Error ---")
-        print(f"Could not connect to the server at {BASE_URL}.")
+        return False
+
+def check_server_status():
+    """Checks if the local LLM server is running before starting.
+
+    With several endpoints (configure_endpoints) every one is checked; those
+    that do not answer are left out of the run, which goes ahead as long as
+    one is up.
+    """
+    pool = _endpoint_pool
+    endpoints = pool.live_endpoints() if pool is not None else [BASE_URL]
+    up = [endpoint for endpoint in endpoints if endpoint_is_up(endpoint)]
+    for endpoint in endpoints:
+        if endpoint in up:
+            print(f"Successfully connected to the server at {endpoint}")
+        else:
+            print(f"--- Connection Error ---")
+            print(f"Could not connect to the server at {endpoint}.")
+            if pool is not None:
+                pool.mark_down(endpoint)
+    if not up:
         print(f"Please make sure your local LLM server (e.g., Ollama) is running.")
         return False
+    return True
 
-def get_api_response(prompt_text, model_name, temperature, provider='openai', base_url=None):
-    """Get response from external API (OpenAI-compatible)."""
+class EndpointPool:
+    """Local inference servers sharing the requests of a run.
+
+    Each endpoint takes up to ``slots`` requests at a time. A request goes
+    to whichever endpoint frees a slot first, so faster hosts end up serving
+    more of the run. An endpoint that stops answering is marked down and the
+    requests it was serving are sent to the others (see
+    get_pooled_local_response).
+    """
+
+    def __init__(self, endpoints, slots=OLLAMA_MAX_CONCURRENCY):
+        self.endpoints = list(dict.fromkeys(endpoint.rstrip('/') for endpoint in endpoints))
+        self.slots = max(1, slots)
+        self.in_flight = {endpoint: 0 for endpoint in self.endpoints}
+        self.served = {endpoint: 0 for endpoint in self.endpoints}
+        self.down = set()
+        self._queue = deque()
+        self._condition = threading.Condition()
+
+    def live_endpoints(self):
+        """Endpoints not marked down."""
+        with self._condition:
+            return [endpoint for endpoint in self.endpoints if endpoint not in self.down]
+
+    def acquire(self):
+        """Block until an endpoint has a free slot and take it; None if all are down.
+
+        Waiting requests get slots in arrival order (see FairSemaphore).
+        """
+        with self._condition:
+            ticket = object()
+            self._queue.append(ticket)
+            try:
+                while True:
+                    live = [endpoint for endpoint in self.endpoints if endpoint not in self.down]
+                    if not live:
+                        return None
+                    free = [endpoint for endpoint in live if self.in_flight[endpoint] < self.slots]
+                    if free and self._queue[0] is ticket:
+                        endpoint = min(free, key=lambda endpoint: self.in_flight[endpoint])
+                        self.in_flight[endpoint] += 1
+                        return endpoint
+                    self._condition.wait()
+            finally:
+                self._queue.remove(ticket)
+                self._condition.notify_all()
+
+    def release(self, endpoint, served=True):
+        """Give back a slot taken by acquire()."""
+        with self._condition:
+            self.in_flight[endpoint] -= 1
+            if served:
+                self.served[endpoint] += 1
+            self._condition.notify_all()
+
+    def mark_down(self, endpoint):
+        """Stop sending requests to an endpoint."""
+        with self._condition:
+            if endpoint not in self.down:
+                self.down.add(endpoint)
+                print(f"Endpoint {endpoint} is down; its requests go to the other endpoints")
+            self._condition.notify_all()
+
+    def stats_line(self):
+        """One-line summary of the requests each endpoint served."""
+        parts = [f"{endpoint} {self.served[endpoint]}" + (" (down)" if endpoint in self.down else "")
+                 for endpoint in self.endpoints]
+        return "Requests per endpoint: " + ", ".join(parts)
+
+def configure_endpoints(endpoints):
+    """Share local requests across several servers from now on (None or [] for BASE_URL alone)."""
+    global _endpoint_pool
+    _endpoint_pool = EndpointPool(endpoints, OLLAMA_MAX_CONCURRENCY) if endpoints else None
+    return _endpoint_pool
+
+def local_endpoints():
+    """Base URLs of the local servers a run uses."""
+    return _endpoint_pool.live_endpoints() if _endpoint_pool is not None else [BASE_URL]
+
+class StreamingJsonScanner:
+    """Finds complete top-level JSON objects in text that arrives in pieces.
+
+    Each call to feed() scans only the new text, tracking brace depth and
+    string/escape state, and returns the text of an object as soon as its
+    closing brace arrives.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk):
+        """Add streamed text; return a completed object's text, or None."""
+        self.text += chunk
+        while self._pos < len(self.text):
+            ch = self.text[self._pos]
+            self._pos += 1
+            if self._start is None:
+                if ch == '{':
+                    self._start = self._pos - 1
+                    self._depth = 1
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == '\\':
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == '{':
+                self._depth += 1
+            elif ch == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    completed = self.text[self._start:self._pos]
+                    self._start = None
+                    return completed
+        return None
+
+def read_answer_stream(deltas, expected_keys, started, details=None):
+    """Consume streamed text until a complete answer object has arrived.
+
+    ``deltas`` yields pieces of the model's reply. Reading stops at the first
+    JSON object holding all of ``expected_keys`` (any object if None), so the
+    caller can close the connection without waiting for the rest of the
+    generation. Returns (raw_text, answer); answer is None if the stream
+    ended without one.
+    """
+    scanner = StreamingJsonScanner()
+    for delta in deltas:
+        if details is not None and 'ttft_s' not in details:
+            details['ttft_s'] = round(time.monotonic() - started, 3)
+        candidate = scanner.feed(delta)
+        if candidate is None:
+            continue
+        try:
+            answer = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        if expected_keys is None or all(key in answer for key in expected_keys):
+            if details is not None:
+                details['answer_s'] = round(time.monotonic() - started, 3)
+            return scanner.text, answer
+    if details is not None:
+        details['answer_s'] = round(time.monotonic() - started, 3)
+    return scanner.text, None
+
+def record_usage(details, usage):
+    """Copy prompt and completion token counts from a reply's ``usage`` into ``details``."""
+    if details is None or not usage:
+        return
+    for key in ('prompt_tokens', 'completion_tokens'):
+        value = usage.get(key) if isinstance(usage, dict) else getattr(usage, key, None)
+        if value is not None:
+            details[key] = value
+
+def iter_sse_deltas(response, details=None):
+    """Yield content deltas from an OpenAI-style server-sent event stream.
+
+    Token usage from the final event, if the stream is read that far, is
+    recorded into ``details``.
+    """
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith('data:'):
+            continue
+        data = line[5:].strip()
+        if data == '[DONE]':
+            break
+        event = json.loads(data)
+        record_usage(details, event.get('usage'))
+        choices = event.get('choices') or []
+        if choices:
+            content = (choices[0].get('delta') or {}).get('content')
+            if content:
+                yield content
+
+def record_ollama_metrics(details, body):
+    """Copy token counts and model load time from a native Ollama reply into ``details``."""
+    if details is None:
+        return
+    if body.get('prompt_eval_count') is not None:
+        details['prompt_tokens'] = body['prompt_eval_count']
+    if body.get('eval_count') is not None:
+        details['completion_tokens'] = body['eval_count']
+    if body.get('load_duration') is not None:
+        details['load_s'] = round(body['load_duration'] / 1e9, 3)
+
+def iter_ndjson_deltas(response, details=None):
+    """Yield content deltas from a native Ollama stream (one JSON object per line).
+
+    Token counts and load time from the final object, if the stream is read
+    that far, are recorded into ``details``.
+    """
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            continue
+        event = json.loads(line)
+        if event.get('done'):
+            record_ollama_metrics(details, event)
+            break
+        content = (event.get('message') or {}).get('content')
+        if content:
+            yield content
+
+def iter_chunk_deltas(stream, details=None):
+    """Yield content deltas from an OpenAI client stream, recording usage like iter_sse_deltas()."""
+    for chunk in stream:
+        record_usage(details, chunk.usage)
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def get_api_response(prompt_text, model_name, temperature, provider='openai', base_url=None,
+                     expected_keys=None, details=None, schema=None, max_tokens=None, samples=1):
+    """Get response from external API (OpenAI-compatible).
+
+    With streaming enabled (configure_requests) the reply is read only until
+    a complete answer object has arrived. Timings, token usage, HTTP status,
+    retries and the raw reply go into ``details``. A JSON ``schema`` is sent
+    as a ``response_format`` of the kind the provider supports (see
+    API_PROVIDERS), or left out if it supports none.
+    With ``samples`` > 1 the request asks for that many completions (``n``,
+    never streamed) and a list of answers is returned, possibly shorter if
+    the provider ignores ``n``; the raw replies go into
+    ``details['raw_responses']``.
+    """
     if OpenAI is None:
         print("Error: OpenAI library not installed. Run: pip install openai")
-        return None
-    
-    # Get API key from environment
-    provider_config = API_PROVIDERS.get(provider, API_PROVIDERS['openai'])
-    api_key = os.getenv(provider_config['env_key'])
-    
-    if not api_key:
-        print(f"Error: {provider_config['env_key']} not found in environment variables.")
-        print(f"Please add it to your .env file: {provider_config['env_key']}=your_key_here")
-        return None
+        return transport_error("OpenAI library not installed")
     
+    client = get_api_client(provider, base_url)
+    if client is None:
+        return transport_error(f"No API key for {provider}")
+
+    stream = STREAM_RESPONSES and samples == 1
+
+    def send():
+        started = time.monotonic()
+        try:
+            response = client.chat.completions.create(**request)
+            if details is not None:
+                details['http_status'] = 200
+            if not stream:
+                if details is not None:
+                    details['answer_s'] = round(time.monotonic() - started, 3)
+                record_usage(details, response.usage)
+                if samples > 1:
+                    choices = sorted(response.choices, key=lambda choice: choice.index)
+                    return [choice.message.content or "" for choice in choices], None
+                return response.choices[0].message.content or "", None
+            try:
+                return read_answer_stream(iter_chunk_deltas(response, details), expected_keys,
+                                          started, details)
+            finally:
+                response.close()
+        except RateLimitError as e:
+            raise TransientError(str(e), 429, parse_retry_after(e.response.headers))
+        except InternalServerError as e:
+            raise TransientError(str(e), e.status_code, parse_retry_after(e.response.headers))
+        except APIConnectionError as e:
+            raise TransientError(str(e))
+
+    response_format = API_PROVIDERS.get(provider, {}).get('response_format')
+    constrained = schema is not None and bool(response_format)
+    if not constrained:
+        # The schema-sized budget is only safe when the reply is constrained
+        max_tokens = None
+    request = {
+        'model': model_name,
+        'messages': build_messages(prompt_text),
+        'temperature': temperature,
+        'max_tokens': max_tokens or 1000,
+        'stream': stream
+    }
+    if stream:
+        # Token usage arrives in a final chunk when the stream is read to the end
+        request['stream_options'] = {'include_usage': True}
+    if samples > 1:
+        request['n'] = samples
+    if constrained:
+        request['response_format'] = build_response_format(schema, response_format)
+
+    raw_response_text = ""
     try:
-        # Initialize client
-        client_kwargs = {'api_key': api_key}
-        if base_url or provider_config.get('base_url'):
-            client_kwargs['base_url'] = base_url or provider_config['base_url']
-        
-        client = OpenAI(**client_kwargs)
-        
-        # Make API call
-        response = client.chat.completions.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": "Answer in JSON only. No extra text. Use the schema given."},
-                {"role": "user", "content": prompt_text}
-            ],
-            temperature=temperature,
-            max_tokens=1000
-        )
-        
-        raw_response_text = response.choices[0].message.content
-        
-        # Clean up response
-        cleaned_text = raw_response_text.strip()
-        if cleaned_text.startswith("```json"):
-            cleaned_text = cleaned_text[7:]
-        if cleaned_text.endswith("```"):
-            cleaned_text = cleaned_text[:-3]
-        
-        return json.loads(cleaned_text.strip())
-        
+        raw_response_text, answer = call_with_retries(send, get_rate_limiter(provider),
+                                                      details=details)
+        if samples > 1:
+            if details is not None:
+                details['raw_responses'] = raw_response_text
+            return [parse_sample_reply(text) for text in raw_response_text]
+        if details is not None:
+            details['raw_response'] = raw_response_text
+        if answer is not None:
+            return answer
+        # Constrained replies are usually bare JSON, but not every backend enforces the schema
+        return parse_json_answer(raw_response_text)
+
+    except (TransientError, APIStatusError) as e:
+        if details is not None:
+            details['http_status'] = e.status_code
+        print(f"\n--- API Error ({provider}) ---")
+        print(f"Error communicating with {provider} API: {e}")
+        return transport_error(f"API call failed: {str(e)}")
+    except json.JSONDecodeError:
+        print(f"\n--- Model Output Error ({provider}) ---")
+        print(f"The model did not return valid JSON. Raw response was:")
+        print(f"'{raw_response_text}'")
+        return {"error": "Invalid JSON response from model"}
     except Exception as e:
         print(f"\n--- API Error ({provider}) ---")
         print(f"Error communicating with {provider} API: {e}")
         return {"error": f"API call failed: {str(e)}"}
 
-def get_llm_response(prompt_text, model_name, temperature, api_provider=None):
-    """Sends a prompt to local or external LLM and gets a JSON response."""
-    # Check if this is an API model
-    if api_provider:
-        return get_api_response(prompt_text, model_name, temperature, api_provider)
-    
-    # Original local server logic
-    system_message = "Answer in JSON only. No extra text. Use the schema given."
-    
-    headers = {"Content-Type": "application/json"}
-    payload = {
-        "model": model_name,
-        "messages": [
-            {"role": "system", "content": system_message},
-            {"role": "user", "content": prompt_text}
-        ],
-        "format": "json",
-        "stream": False,
-        "temperature": temperature
-    }
+def get_local_response(prompt_text, model_name, temperature, expected_keys=None, details=None,
+                       schema=None, max_tokens=None, base_url=None):
+    """Sends a prompt to the local server (e.g. Ollama) and gets a JSON response.
+
+    With streaming enabled (configure_requests) the reply is read only until
+    a complete answer object has arrived. Timings, token usage, HTTP status,
+    retries and the raw reply go into ``details``. A JSON ``schema`` is
+    passed as Ollama's schema-constrained ``format`` on /api/chat, or as a
+    ``response_format`` on the OpenAI-compatible API. With OLLAMA_NATIVE the
+    request goes to Ollama's own /api/chat (see configure_ollama), which
+    also reports the time spent loading the model. ``base_url`` picks the
+    server (default: BASE_URL, or API_URL for the OpenAI-compatible API).
+    """
+    if OLLAMA_NATIVE:
+        url = f"{base_url or BASE_URL}/api/chat"
+        payload = {
+            "model": model_name,
+            "messages": build_messages(prompt_text),
+            "format": schema if schema is not None else "json",
+            "stream": STREAM_RESPONSES,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "options": ollama_options(temperature, max_tokens)
+        }
+    else:
+        url = f"{base_url}/v1/chat/completions" if base_url else API_URL
+        payload = {
+            "model": model_name,
+            "messages": build_messages(prompt_text),
+            # The OpenAI-compatible API reads response_format, not format
+            "response_format": (build_response_format(schema) if schema is not None
+                                else build_response_format(None, 'json_object')),
+            "stream": STREAM_RESPONSES,
+            "temperature": temperature
+        }
+        if max_tokens:
+            payload["max_tokens"] = max_tokens
+        if STREAM_RESPONSES:
+            payload["stream_options"] = {"include_usage": True}
+
+    def send():
+        started = time.monotonic()
+        try:
+            response = get_http_session().post(url, json=payload, timeout=REQUEST_TIMEOUT,
+                                               stream=STREAM_RESPONSES)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if details is not None:
+                details['http_status'] = None
+            raise TransientError(str(e))
+        if details is not None:
+            details['http_status'] = response.status_code
+        try:
+            if response.status_code == 429 or response.status_code >= 500:
+                raise TransientError(f"HTTP {response.status_code} from {url}",
+                                     response.status_code, parse_retry_after(response.headers))
+            response.raise_for_status()
+            if not STREAM_RESPONSES:
+                if details is not None:
+                    details['answer_s'] = round(time.monotonic() - started, 3)
+                body = response.json()
+                if OLLAMA_NATIVE:
+                    record_ollama_metrics(details, body)
+                    return body['message']['content'], None
+                record_usage(details, body.get('usage'))
+                return body['choices'][0]['message']['content'], None
+            deltas = (iter_ndjson_deltas(response, details) if OLLAMA_NATIVE
+                      else iter_sse_deltas(response, details))
+            return read_answer_stream(deltas, expected_keys, started, details)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError) as e:
+            # The connection dropped part-way through the stream
+            raise TransientError(str(e))
+        finally:
+            response.close()
 
     raw_response_text = ""
     try:
-        response = requests.post(API_URL, headers=headers, json=payload, timeout=60)
-        response.raise_for_status()
-        
-        response_data = response.json()
-        raw_response_text = response_data['choices'][0]['message']['content']
-
-        cleaned_text = raw_response_text.strip()
-        if cleaned_text.startswith("```json"):
-            cleaned_text = cleaned_text[7:]
-        if cleaned_text.endswith("```"):
-            cleaned_text = cleaned_text[:-3]
-        
-        return json.loads(cleaned_text.strip())
+        raw_response_text, answer = call_with_retries(send, details=details)
+        if details is not None:
+            details['raw_response'] = raw_response_text
+        if answer is not None:
+            return answer
+        # Constrained replies are usually bare JSON, but not every backend enforces the schema
+        return parse_json_answer(raw_response_text)
 
-    except requests.exceptions.RequestException as e:
+    except (TransientError, requests.exceptions.RequestException) as e:
         print(f"\n--- API Error ---")
         print(f"An error occurred while communicating with the model API.")
         print(f"Error details: {e}")
-        return None
+        return transport_error(str(e))
     except json.JSONDecodeError:
         print(f"\n--- Model Output Error ---")
         print(f"The model did not return valid JSON. Raw response was:")
@@ -153,9 +968,197 @@ def get_llm_response(prompt_text, model_name, temperature, api_provider=None):
         print(f"\nAn unexpected error occurred: {e}")
         return None
 
+def get_pooled_local_response(prompt_text, model_name, temperature, details=None, **request):
+    """Send a local request to the first endpoint of the pool with a free slot.
+
+    If the request fails in transport and its endpoint no longer passes a
+    health check, the endpoint is marked down and the request goes back to
+    the pool for another endpoint. ``latency_s`` in ``details`` is timed
+    from when the first endpoint took the request.
+    """
+    pool = _endpoint_pool
+    started = None
+    while True:
+        endpoint = pool.acquire()
+        if endpoint is None:
+            return transport_error("No local endpoint is up")
+        if started is None:
+            started = time.monotonic()
+        llm_answer = get_local_response(prompt_text, model_name, temperature, details=details,
+                                        base_url=endpoint, **request)
+        if (isinstance(llm_answer, dict) and llm_answer.get("transport_error")
+                and not endpoint_is_up(endpoint)):
+            pool.release(endpoint, served=False)
+            pool.mark_down(endpoint)
+            continue
+        pool.release(endpoint)
+        if details is not None:
+            details['latency_s'] = round(time.monotonic() - started, 3)
+        return llm_answer
+
+def response_cache_key(prompt_text, model_name, temperature, schema=None, max_tokens=None,
+                       sample_index=0):
+    """Key of a request in the response cache, or None if it may not be cached.
+
+    Samples after the first get keys of their own, so a cached run keeps
+    its distinct samples.
+    """
+    cache = _response_cache
+    if cache is None or not cache.accepts(temperature):
+        return None
+    options = {'schema': schema, 'max_tokens': max_tokens} if schema is not None else {}
+    if sample_index:
+        options['sample'] = sample_index
+    return cache.make_key(model_name, temperature, SYSTEM_MESSAGE, prompt_text, **options)
+
+def is_valid_answer(llm_answer):
+    """Whether an answer may be stored in the response cache."""
+    return isinstance(llm_answer, dict) and "error" not in llm_answer
+
+def get_llm_response(prompt_text, model_name, temperature, api_provider=None,
+                     expected_keys=None, details=None, schema=None, max_tokens=None,
+                     sample_index=0):
+    """Sends a prompt to local or external LLM and gets a JSON response.
+
+    Answers are served from the response cache when one is configured and
+    the request is cacheable; only valid answers are stored. ``expected_keys``
+    lets a streamed reply stop as soon as an object with those keys arrives,
+    and request metrics (latency, timings, token usage, HTTP status, retries)
+    and the raw reply are written into the ``details`` dict if given. Cache
+    hits record no metrics.
+    ``schema`` and ``max_tokens`` constrain the reply (see --structured), and
+    ``sample_index`` tells repeated samples of one prompt apart in the cache.
+    """
+    cache = _response_cache
+    cache_key = response_cache_key(prompt_text, model_name, temperature, schema, max_tokens,
+                                   sample_index)
+    if cache_key is not None:
+        cached_answer = cache.get(cache_key)
+        if cached_answer is not None:
+            return cached_answer
+
+    if not api_provider and _endpoint_pool is not None:
+        # The pool caps requests per endpoint and times them itself
+        llm_answer = get_pooled_local_response(prompt_text, model_name, temperature,
+                                               expected_keys=expected_keys, details=details,
+                                               schema=schema, max_tokens=max_tokens)
+    else:
+        with get_backend_semaphore(api_provider):
+            started = time.monotonic()
+            # Check if this is an API model
+            if api_provider:
+                llm_answer = get_api_response(prompt_text, model_name, temperature, api_provider,
+                                              expected_keys=expected_keys, details=details,
+                                              schema=schema, max_tokens=max_tokens)
+            else:
+                llm_answer = get_local_response(prompt_text, model_name, temperature,
+                                                expected_keys=expected_keys, details=details,
+                                                schema=schema, max_tokens=max_tokens)
+            if details is not None:
+                # Wall time of the request, including retries and rate-limit waits
+                details['latency_s'] = round(time.monotonic() - started, 3)
+
+    if cache_key is not None and is_valid_answer(llm_answer):
+        cache.put(cache_key, model_name, llm_answer)
+    return llm_answer
+
+def split_usage(details, count):
+    """Take the token counts and answer time out of ``details``, split into ``count`` shares.
+
+    Token counts stay whole: the remainder goes one token each to the first shares.
+    """
+    shares = [{} for _ in range(count)]
+    if not count:
+        return shares
+    for key in ('prompt_tokens', 'completion_tokens'):
+        if key in details:
+            share, remainder = divmod(details.pop(key), count)
+            for i in range(count):
+                shares[i][key] = share + (i < remainder)
+    if 'answer_s' in details:
+        answer_s = details.pop('answer_s')
+        for i in range(count):
+            shares[i]['answer_s'] = round(answer_s / count, 3)
+    return shares
+
+def get_llm_samples(prompt_text, model_name, temperature, api_provider=None, samples=1,
+                    expected_keys=None, schema=None, max_tokens=None):
+    """Get ``samples`` answers to one prompt.
+
+    Providers marked 'multi_sample' are asked for all of them in one request
+    (see get_api_response); other backends, and any samples such a request
+    fell short of, get one concurrent request per sample through
+    get_llm_response(). Returns a list of (answer, details) pairs in sample
+    order. A multi-sample request's tokens and answer time are split evenly
+    across its samples, so every sample row carries its share as a row of
+    its own request would; latency, status and retries stay with the first
+    sample so they are counted once per request.
+    """
+    def ask(sample_index):
+        details = {}
+        answer = get_llm_response(prompt_text, model_name, temperature, api_provider,
+                                  expected_keys=expected_keys, details=details, schema=schema,
+                                  max_tokens=max_tokens, sample_index=sample_index)
+        return answer, details
+
+    if samples <= 1:
+        return [ask(0)]
+
+    results = []
+    if api_provider and API_PROVIDERS[api_provider].get('multi_sample'):
+        cache = _response_cache
+        cache_keys = [response_cache_key(prompt_text, model_name, temperature, schema,
+                                         max_tokens, i) for i in range(samples)]
+        cached_answers = [cache.get(key) for key in cache_keys] if cache_keys[0] is not None else []
+        if cached_answers and all(answer is not None for answer in cached_answers):
+            return [(answer, {}) for answer in cached_answers]
+
+        details = {}
+        with get_backend_semaphore(api_provider):
+            started = time.monotonic()
+            answers = get_api_response(prompt_text, model_name, temperature, api_provider,
+                                       details=details, schema=schema, max_tokens=max_tokens,
+                                       samples=samples)
+            details['latency_s'] = round(time.monotonic() - started, 3)
+        raw_responses = details.pop('raw_responses', [])
+        if isinstance(answers, dict):
+            # The request failed; every sample shares the error
+            answers = [answers] * samples
+        answers = answers[:samples]
+        shares = split_usage(details, len(answers))
+        for i, answer in enumerate(answers):
+            sample_details = dict(details, **shares[i]) if i == 0 else shares[i]
+            if i < len(raw_responses):
+                sample_details['raw_response'] = raw_responses[i]
+            results.append((answer, sample_details))
+            if cache_keys[i] is not None and is_valid_answer(answer):
+                cache.put(cache_keys[i], model_name, answer)
+
+    missing = range(len(results), samples)
+    if missing:
+        with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+            results.extend(executor.map(ask, missing))
+    return results
+
+def choice_index(value):
+    """A multiple-choice answer or correct_index as an index: int() of it, None if that fails.
+
+    Shared with rescore_results.py so that re-scoring reads choices exactly
+    as the live run does (1.7 is 1; "1.0" is not an index).
+    """
+    try:
+        return int(value)
+    except (ValueError, TypeError, OverflowError):
+        return None
 
 def score_response(question, llm_answer):
-    """Scores the LLM's answer based on the rules in the question JSON."""
+    """Scores the LLM's answer based on the rules in the question JSON.
+
+    Requests that failed in transport are reported as "Error" rather than
+    "Incorrect" so they do not count against the model's accuracy.
+    """
+    if llm_answer and llm_answer.get("transport_error"):
+        return "Error", f"Request failed: {llm_answer.get('error')}"
     if not llm_answer or "error" in llm_answer:
         return "Incorrect", "Model did not provide a valid answer."
 
@@ -166,14 +1169,12 @@ def score_response(question, llm_answer):
         if scoring_rules.get("method") == "choice_equals_index":
             expected_index = question.get("correct_index")
             actual_choice = llm_answer.get("choice")
-            
-            try:
-                if int(expected_index) == int(actual_choice):
-                    return "Correct", f"Model chose index {actual_choice}."
-                else:
-                    return "Incorrect", f"Model chose index {actual_choice}, expected {expected_index}."
-            except (ValueError, TypeError):
+
+            if choice_index(actual_choice) is None or choice_index(expected_index) is None:
                 return "Incorrect", f"Model returned a non-integer choice: '{actual_choice}'."
+            if choice_index(expected_index) == choice_index(actual_choice):
+                return "Correct", f"Model chose index {actual_choice}."
+            return "Incorrect", f"Model chose index {actual_choice}, expected {expected_index}."
 
     elif answer_type == "structured_single":
         answer_key = list(llm_answer.keys())[0]
@@ -200,25 +1201,211 @@ def score_response(question, llm_answer):
 def write_csv_header(output_file):
     """Write the CSV header if the file doesn't exist."""
     with open(output_file, 'w', newline='') as csvfile:
-        fieldnames = ['timestamp', 'model_name', 'temperature', 'task_id', 'domain', 'result']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES)
         writer.writeheader()
 
-def append_result_to_csv(output_file, model_name, temperature, task_id, domain, result):
-    """Append a single result to the CSV file."""
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    
-    with open(output_file, 'a', newline='') as csvfile:
-        fieldnames = ['timestamp', 'model_name', 'temperature', 'task_id', 'domain', 'result']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writerow({
-            'timestamp': timestamp,
+def upgrade_csv_header(output_file):
+    """Rewrite a results file written with an older column set.
+
+    Files whose header is a subset of CSV_FIELDNAMES are rewritten with the
+    current header (new columns left blank). Returns True if upgraded;
+    raises ValueError for a header with unknown columns.
+    """
+    with open(output_file, 'r', newline='') as csvfile:
+        reader = csv.DictReader(csvfile)
+        header = reader.fieldnames or []
+        if header == CSV_FIELDNAMES:
+            return False
+        unknown = [column for column in header if column not in CSV_FIELDNAMES]
+        if unknown:
+            raise ValueError(f"{output_file} has unexpected columns: {unknown}")
+        rows = list(reader)
+
+    temp_file = output_file + '.tmp'
+    with open(temp_file, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(rows)
+        csvfile.flush()
+        os.fsync(csvfile.fileno())
+    os.replace(temp_file, output_file)
+    return True
+
+def repair_partial_row(output_file):
+    """Drop a trailing partial row left behind by an interrupted write.
+
+    Stored replies may span several lines, so the file is scanned for the
+    end of the last complete record rather than the last newline.
+    Returns True if the file was truncated.
+    """
+    with open(output_file, 'rb+') as f:
+        complete_end = 0
+        offset = 0
+        quoted = False
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                break
+            end, quoted = results_store.scan_csv_records(chunk, quoted)
+            if end:
+                complete_end = offset + end
+            offset += len(chunk)
+        if complete_end == offset:
+            return False
+        f.truncate(complete_end)
+        return True
+
+def load_completed_index(path):
+    """Map (model_name, temperature, task_id) to {sample_index: result} already recorded.
+
+    ``path`` is a results CSV or a Parquet results store directory; rows
+    without a sample index (runs without --samples) are sample None. Rows
+    that failed in transport ("Error") are left out so they are re-run.
+    """
+    completed = {}
+    if not os.path.exists(path):
+        return completed
+    if os.path.isdir(path):
+        table = results_store.read_table(path, columns=['model_name', 'temperature',
+                                                               'task_id', 'sample_index', 'result'])
+        rows = table.to_pylist()
+    else:
+        with open(path, 'r', newline='') as csvfile:
+            rows = list(csv.DictReader(csvfile))
+    for row in rows:
+        try:
+            key = (row['model_name'], float(row['temperature']), row['task_id'])
+            sample_index = row.get('sample_index')
+            sample_index = int(float(sample_index)) if sample_index not in (None, '') else None
+        except (KeyError, TypeError, ValueError):
+            continue
+        if row['result'] != 'Error':
+            completed.setdefault(key, {})[sample_index] = row['result']
+    return completed
+
+_csv_lock = threading.Lock()
+
+def append_rows_to_csv(output_file, rows):
+    """Append result rows (dicts keyed by CSV_FIELDNAMES) to the CSV file.
+
+    The rows are written with a single write and fsync'd, so a crash can
+    leave at most one partial final line, which repair_partial_row() removes.
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDNAMES)
+    writer.writerows(rows)
+
+    with _csv_lock:
+        with open(output_file, 'a', newline='') as csvfile:
+            csvfile.write(buffer.getvalue())
+            csvfile.flush()
+            os.fsync(csvfile.fileno())
+
+class ResultsWriter:
+    """Buffer result rows and write them out in batches.
+
+    Rows are flushed every RESULTS_FLUSH_ROWS rows or RESULTS_FLUSH_SECONDS
+    seconds, and on close(). Each flush either appends to the CSV with one
+    append_rows_to_csv() call or, when ``store_dir`` is given, adds new files
+    to the Parquet results store. Rows still buffered when the process dies
+    are lost; --resume runs those items again.
+    """
+
+    def __init__(self, output_file=None, store_dir=None, flush_rows=RESULTS_FLUSH_ROWS,
+                 flush_seconds=RESULTS_FLUSH_SECONDS):
+        self.output_file = output_file
+        self.store_dir = store_dir
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self._rows = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    @property
+    def location(self):
+        """Where the results end up: the store directory or the CSV file."""
+        return self.store_dir or self.output_file
+
+    def add(self, model_name, temperature, task_id, domain, result, details=None):
+        """Buffer a single result, plus any request details."""
+        row = {
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'model_name': model_name,
             'temperature': temperature,
             'task_id': task_id,
             'domain': domain,
             'result': result
-        })
+        }
+        row.update(details or {})
+        self.add_rows([row])
+
+    def add_rows(self, rows):
+        """Buffer result rows (dicts keyed by CSV_FIELDNAMES), flushing if due."""
+        with self._lock:
+            self._rows.extend(rows)
+            if (len(self._rows) >= self.flush_rows
+                    or time.monotonic() - self._last_flush >= self.flush_seconds):
+                self._flush_locked()
+
+    def flush(self):
+        """Write out all buffered rows."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        rows, self._rows = self._rows, []
+        self._last_flush = time.monotonic()
+        if not rows:
+            return
+        if self.store_dir:
+            results_store.write_rows(self.store_dir, rows)
+        else:
+            append_rows_to_csv(self.output_file, rows)
+
+    def close(self):
+        """Flush any remaining rows."""
+        self.flush()
+
+class FairSemaphore:
+    """Semaphore that hands freed slots to waiting threads in arrival order.
+
+    threading.Semaphore lets a thread that arrives just as a slot frees up
+    take it ahead of threads already waiting. With more workers than slots,
+    the item the in-order writer needs next can then lose out over and over,
+    and nothing is written until the run is almost done.
+    """
+
+    def __init__(self, value=1):
+        self._value = value
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a slot, waiting behind any threads already waiting for one."""
+        with self._lock:
+            if self._value > 0 and not self._waiters:
+                self._value -= 1
+                return True
+            waiter = threading.Lock()
+            waiter.acquire()
+            self._waiters.append(waiter)
+        # release() hands its slot straight to the longest waiting thread
+        waiter.acquire()
+        return True
+
+    def release(self):
+        """Give back a slot."""
+        with self._lock:
+            if self._waiters:
+                self._waiters.popleft().release()
+            else:
+                self._value += 1
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
 
 def detect_api_provider(model_name):
     """Auto-detect API provider based on model name."""
@@ -227,19 +1414,906 @@ def detect_api_provider(model_name):
             return provider
     return None
 
+def reset_backend_limits():
+    """Drop the per-backend semaphores and rate limiters.
+
+    They are rebuilt from OLLAMA_MAX_CONCURRENCY and API_PROVIDERS on next
+    use, so changes to those settings take effect.
+    """
+    with _backend_semaphores_lock:
+        _backend_semaphores.clear()
+    with _rate_limiters_lock:
+        _rate_limiters.clear()
+
+def get_backend_semaphore(api_provider=None):
+    """Return the semaphore that caps in-flight requests for a backend."""
+    backend = api_provider or 'ollama'
+    with _backend_semaphores_lock:
+        if backend not in _backend_semaphores:
+            if api_provider:
+                limit = API_PROVIDERS[api_provider].get('max_concurrency', 1)
+            else:
+                limit = OLLAMA_MAX_CONCURRENCY
+            _backend_semaphores[backend] = FairSemaphore(max(1, limit))
+        return _backend_semaphores[backend]
+
+def build_question_text(question):
+    """Render an item's question and, for multiple choice, its choices."""
+    if 'compiled' in question:
+        return question['compiled']['question_text']
+    prompt = question["prompt"]
+    if question['answer_type'] == 'multiple_choice':
+        choices_text = "\n".join([f"{idx}) {choice}" for idx, choice in enumerate(question['choices'])])
+        return f"{prompt}\n\nChoices:\n{choices_text}"
+    return prompt
+
+def schema_hint(question):
+    """The free-text answer schema shown to the model in the prompt."""
+    if 'compiled' in question:
+        return question['compiled']['schema_hint']
+    if question['answer_type'] == 'multiple_choice':
+        return '{"choice": <integer>}'
+    else: # structured_single
+        return json.dumps({k: v['type'] for k, v in question['output_schema']['properties'].items()})
+
+def build_prompt(question):
+    """Render the full prompt (question, choices and schema) for an item."""
+    if 'compiled' in question:
+        return question['compiled']['prompt']
+    return f"{build_question_text(question)}\n\nAnswer with JSON using this schema:\n{schema_hint(question)}"
+
+def build_packed_prompt(questions):
+    """Render one prompt asking for the answers to several items at once."""
+    sections = [
+        f"### Question {question['task_id']}\n{build_question_text(question)}\n"
+        f"Answer fields: {schema_hint(question)}"
+        for question in questions
+    ]
+    schema = '{"answers": [{"task_id": "<task_id>", <answer fields>}, ...]}'
+    return (f"Answer each of the following {len(questions)} questions, "
+            f"which are labelled with their task_id.\n\n" + "\n\n".join(sections) +
+            f"\n\nAnswer with JSON using this schema, with one entry per question:\n{schema}")
+
+def answer_keys(question):
+    """Keys a complete answer to this item must contain."""
+    if question['answer_type'] == 'multiple_choice':
+        return ['choice']
+    output_schema = question.get('output_schema', {})
+    return output_schema.get('required') or list(output_schema.get('properties', {}))
+
+def build_answer_schema(question):
+    """JSON schema for a valid answer to this item.
+
+    Multiple-choice items allow only the indices of their choices;
+    structured items use the properties of their ``output_schema``.
+    Items from the item bank carry the schema pre-rendered.
+    """
+    if 'compiled' in question:
+        # A copy, as build_packed_schema() replaces its fields
+        return dict(question['compiled']['answer_schema'])
+    if question['answer_type'] == 'multiple_choice':
+        properties = {'choice': {'type': 'integer', 'enum': list(range(len(question['choices'])))}}
+    else: # structured_single
+        properties = {
+            key: {'type': spec['type']}
+            for key, spec in question['output_schema']['properties'].items()
+        }
+    return {
+        'type': 'object',
+        'properties': properties,
+        'required': list(properties),
+        'additionalProperties': False
+    }
+
+def answer_max_tokens(schema):
+    """Output token budget for an answer matching ``schema``."""
+    return STRUCTURED_BASE_TOKENS + sum(
+        STRUCTURED_FIELD_TOKENS.get(spec.get('type'), STRUCTURED_FIELD_TOKENS['string'])
+        for spec in schema['properties'].values()
+    )
+
+def build_response_format(schema, mode='json_schema'):
+    """OpenAI-style response_format that enforces ``schema``, or only JSON for mode 'json_object'."""
+    if mode == 'json_object':
+        return {'type': 'json_object'}
+    return {
+        'type': 'json_schema',
+        'json_schema': {'name': 'answer', 'schema': schema, 'strict': True}
+    }
+
+def build_packed_schema(questions):
+    """JSON schema for a packed reply: one tagged answer per item."""
+    entries = []
+    for question in questions:
+        entry = build_answer_schema(question)
+        entry['properties'] = {'task_id': {'type': 'string', 'enum': [question['task_id']]},
+                               **entry['properties']}
+        entry['required'] = list(entry['properties'])
+        entries.append(entry)
+    return {
+        'type': 'object',
+        'properties': {'answers': {'type': 'array', 'items': {'anyOf': entries}}},
+        'required': ['answers'],
+        'additionalProperties': False
+    }
+
+def unpack_answers(packed_answer):
+    """Map task_id to the answer fields found in a packed reply."""
+    answers = {}
+    if not isinstance(packed_answer, dict) or not isinstance(packed_answer.get('answers'), list):
+        return answers
+    for entry in packed_answer['answers']:
+        if isinstance(entry, dict) and isinstance(entry.get('task_id'), str):
+            fields = {k: v for k, v in entry.items() if k != 'task_id'}
+            answers.setdefault(entry['task_id'], fields)
+    return answers
+
+def serialize_answer(llm_answer):
+    """JSON text of a parsed answer for the results file ('' if none)."""
+    if not isinstance(llm_answer, dict) or "error" in llm_answer:
+        return ""
+    return json.dumps(llm_answer)
+
+def stratified_order(questions, seed=ADAPTIVE_SEED):
+    """Shuffle items so that every prefix is spread across domains and difficulties.
+
+    Each (domain, difficulty) stratum is shuffled and its items are placed
+    at evenly spaced, jittered positions through the order, so stopping
+    after any number of items leaves a sample that mirrors the item bank.
+    The same ``seed`` gives every model the same order.
+    """
+    rng = random.Random(seed)
+    strata = {}
+    for question in questions:
+        strata.setdefault((question.get('domain'), question.get('difficulty')), []).append(question)
+    positions = []
+    for members in strata.values():
+        rng.shuffle(members)
+        positions.extend(((i + rng.random()) / len(members), rng.random(), question)
+                         for i, question in enumerate(members))
+    positions.sort(key=lambda position: position[:2])
+    return [question for _, _, question in positions]
+
+def wilson_interval(correct, total, z):
+    """Wilson score interval for an accuracy of ``correct`` out of ``total``."""
+    if total == 0:
+        return 0.0, 1.0
+    p = correct / total
+    denominator = 1 + z * z / total
+    centre = (p + z * z / (2 * total)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total)) / denominator
+    return max(0.0, centre - half_width), min(1.0, centre + half_width)
+
+class EarlyStopping:
+    """Decides when a run's accuracy is settled well enough to stop early.
+
+    Tracks the correct/scored counts of every (model_name, temperature) run
+    in a sweep. With a ``target`` a run stops once the Wilson interval of
+    its accuracy lies entirely above or below the target; without one, once
+    its interval is clear of those of all other runs at the same temperature
+    (its rank is settled), so a run with no other run at its temperature
+    cannot stop until one has results. Runs are checked every
+    ``check_every`` scored items from ``min_items`` on, counting items, not
+    samples, and the error rate ``1 - confidence`` is split across all
+    planned checks so repeated looks do not inflate it.
+    """
+
+    def __init__(self, total_items, confidence=ADAPTIVE_CONFIDENCE, target=None,
+                 min_items=ADAPTIVE_MIN_ITEMS, check_every=ADAPTIVE_CHECK_EVERY):
+        self.target = target
+        self.min_items = min_items
+        self.check_every = max(1, check_every)
+        self.confidence = confidence
+        checks = math.ceil(max(0, total_items - min_items) / self.check_every) + 1
+        self.z = NormalDist().inv_cdf(1 - (1 - confidence) / checks / 2)
+        self.counts = {}
+        self._checked = {}
+        self._lock = threading.Lock()
+
+    def interval(self, key):
+        """Current Wilson interval for a run."""
+        with self._lock:
+            correct, scored = self.counts.get(key, (0, 0))
+        return wilson_interval(correct, scored, self.z)
+
+    def rivals(self, key):
+        """Number of other runs at the same temperature with scored answers."""
+        with self._lock:
+            return sum(1 for other, counts in self.counts.items()
+                       if other != key and other[1] == key[1] and counts[1] > 0)
+
+    def update(self, key, correct, scored, items=None):
+        """Record a run's counts; return why it can stop, or None to go on.
+
+        ``correct`` and ``scored`` count answers; ``items`` is the number of
+        distinct items among them (``scored`` if None, as with one sample).
+        """
+        if items is None:
+            items = scored
+        with self._lock:
+            self.counts[key] = (correct, scored)
+            last_check = self._checked.get(key)
+            if items < self.min_items or (last_check is not None
+                                          and items - last_check < self.check_every):
+                return None
+            self._checked[key] = items
+            others = [counts for other, counts in self.counts.items()
+                      if other != key and other[1] == key[1] and counts[1] > 0]
+        low, high = wilson_interval(correct, scored, self.z)
+
+        if self.target is not None:
+            if low > self.target:
+                return f"accuracy {low:.1%}-{high:.1%} is above the target {self.target:.1%}"
+            if high < self.target:
+                return f"accuracy {low:.1%}-{high:.1%} is below the target {self.target:.1%}"
+            return None
+
+        if not others:
+            return None
+        for other_correct, other_scored in others:
+            other_low, other_high = wilson_interval(other_correct, other_scored, self.z)
+            if low <= other_high and other_low <= high:
+                return None
+        return f"accuracy {low:.1%}-{high:.1%} is clear of all {len(others)} other runs (rank settled)"
+
+def run_question(question, model_name, temperature, api_provider=None, sample_indexes=None):
+    """Query the model for a single item and score each sampled answer.
+
+    Asks for SAMPLES answers, or with ``sample_indexes`` for just those
+    samples, one request each (used to fill in missing samples).
+    Returns a list of (result, reason, details), one per sample. Rows only
+    record their sample_index when SAMPLES > 1.
+    """
+    full_prompt = build_prompt(question)
+    schema = build_answer_schema(question) if STRUCTURED_OUTPUT else None
+    max_tokens = answer_max_tokens(schema) if schema is not None else None
+    request = dict(expected_keys=answer_keys(question), schema=schema, max_tokens=max_tokens)
+    if sample_indexes is None:
+        sample_indexes = range(SAMPLES)
+        samples = get_llm_samples(full_prompt, model_name, temperature, api_provider,
+                                  samples=SAMPLES, **request)
+    else:
+        samples = []
+        for sample_index in sample_indexes:
+            details = {}
+            samples.append((get_llm_response(full_prompt, model_name, temperature, api_provider,
+                                             details=details, sample_index=sample_index, **request),
+                            details))
+
+    outcomes = []
+    for sample_index, (llm_answer, details) in zip(sample_indexes, samples):
+        result, reason = score_response(question, llm_answer)
+        details['pack_size'] = 1
+        if SAMPLES > 1:
+            details['sample_index'] = sample_index
+        details['parsed_answer'] = serialize_answer(llm_answer)
+        outcomes.append((result, reason, details))
+    return outcomes
+
+def run_packed_questions(questions, model_name, temperature, api_provider=None):
+    """Ask for several items in one request and score each sampled answer.
+
+    Items missing from a packed reply (or left out by a failed request)
+    are re-queried on their own with run_question(). Returns a list, in the
+    order of ``questions``, of lists of (result, reason, details), one per
+    sample.
+    """
+    schema = build_packed_schema(questions) if STRUCTURED_OUTPUT else None
+    max_tokens = None
+    if schema is not None:
+        max_tokens = sum(answer_max_tokens(build_answer_schema(q)) + 16 for q in questions)
+    samples = get_llm_samples(build_packed_prompt(questions), model_name, temperature,
+                              api_provider, samples=SAMPLES, expected_keys=['answers'],
+                              schema=schema, max_tokens=max_tokens)
+
+    outcomes = [[] for _ in questions]
+    for sample_index, (packed_answer, details) in enumerate(samples):
+        answers = unpack_answers(packed_answer)
+        for question, question_outcomes in zip(questions, outcomes):
+            llm_answer = answers.get(question['task_id'])
+            if llm_answer is None:
+                question_outcomes.extend(run_question(question, model_name, temperature,
+                                                      api_provider, sample_indexes=[sample_index]))
+                continue
+            result, reason = score_response(question, llm_answer)
+            question_details = dict(details, pack_size=len(questions),
+                                    parsed_answer=serialize_answer(llm_answer))
+            if SAMPLES > 1:
+                question_details['sample_index'] = sample_index
+            question_outcomes.append((result, reason, question_details))
+    return outcomes
+
+def run_unit(unit, model_name, temperature, api_provider=None, sample_indexes=None):
+    """Run a list of items as one request (packed) or a single item.
+
+    Returns, for each item, its list of sampled outcomes. ``sample_indexes``
+    restricts a single item to those samples (see run_question).
+    """
+    if len(unit) == 1:
+        return [run_question(unit[0], model_name, temperature, api_provider, sample_indexes)]
+    return run_packed_questions(unit, model_name, temperature, api_provider)
+
+def run_benchmark(questions, model_name, temperature, api_provider, writer, concurrency=1,
+                  log_prefix='', stop_check=None, pending_samples=None, slots=None):
+    """Run every item against one model, writing results in item order.
+
+    Up to ``concurrency`` requests are in flight at once (further capped per
+    backend by get_backend_semaphore, and by ``slots``, a semaphore shared
+    with the other runs of a sweep), each carrying PACK_SIZE items; results
+    are scored and passed to ``writer`` (a ResultsWriter) in the order of
+    ``questions`` regardless of completion order, one row per sample.
+    ``pending_samples`` maps task_id to the sample indexes still missing
+    for items that are partly done (see --resume); those items are asked
+    on their own for just those samples.
+    ``stop_check(correct, scored, items)``, if given, is called after each
+    item with a scored sample, where ``items`` counts the items with a scored
+    sample that were not already partly done; when it returns a reason, items not yet sent are
+    cancelled and results still in flight are discarded. The same happens
+    on Ctrl-C, either directly or signalled by run_sweep().
+    Returns (total_correct, total_scored, total_errors, stop_reason), counted
+    over samples, where errors are transport failures (not scored) and
+    stop_reason is None if every item ran.
+    """
+    total_questions = len(questions)
+    total_correct = 0
+    total_errors = 0
+    total_scored = 0
+    scored_items = 0
+    stop_reason = None
+    pending_samples = pending_samples or {}
+
+    pack_size = max(1, PACK_SIZE)
+    units = []
+    for question in questions:
+        if (not units or len(units[-1]) >= pack_size or question['task_id'] in pending_samples
+                or units[-1][0]['task_id'] in pending_samples):
+            units.append([question])
+        else:
+            units[-1].append(question)
+
+    def run_unit_in_slot(unit, sample_indexes):
+        if slots is None:
+            return run_unit(unit, model_name, temperature, api_provider, sample_indexes)
+        with slots:
+            return run_unit(unit, model_name, temperature, api_provider, sample_indexes)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [
+            executor.submit(run_unit_in_slot, unit,
+                            pending_samples.get(unit[0]['task_id']) if len(unit) == 1 else None)
+            for unit in units
+        ]
+        outcomes = (
+            (question, samples)
+            for unit, future in zip(units, futures)
+            for question, samples in zip(unit, future.result())
+        )
+        try:
+            for i, (question, samples) in enumerate(outcomes):
+                scored_before = total_scored
+                for result, reason, details in samples:
+                    if result == "Correct":
+                        total_correct += 1
+                    if result == "Error":
+                        total_errors += 1
+                    else:
+                        total_scored += 1
+
+                    # Hand the result to the writer as soon as it is next in order
+                    writer.add(model_name, temperature, question["task_id"], question["domain"],
+                               result, details)
+
+                    label = question['task_id']
+                    if SAMPLES > 1:
+                        label += f" #{details['sample_index']}"
+                    print(f"{log_prefix}({i+1}/{total_questions}) {label}: {result} ({reason})")
+
+                if total_scored > scored_before and question['task_id'] not in pending_samples:
+                    scored_items += 1
+                if stop_check is not None and total_scored > scored_before:
+                    stop_reason = stop_check(total_correct, total_scored, scored_items)
+                    if stop_reason:
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        break
+                if _interrupted.is_set():
+                    stop_reason = "interrupted"
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    break
+        except KeyboardInterrupt:
+            # Send nothing more; requests already in flight finish on their own
+            _interrupted.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    return total_correct, total_scored, total_errors, stop_reason
+
+def run_model(questions, model_name, temperature, api_provider, writer, concurrency=1,
+              completed=None, log_prefix='', early_stopping=None, slots=None):
+    """Run one model at one temperature and print its score.
+
+    ``completed`` is an index from load_completed_index(); samples found in
+    it are skipped and counted towards the score (used by --resume).
+    With ``early_stopping`` (an EarlyStopping) the run ends as soon as its
+    accuracy is settled (used by --adaptive). ``slots`` is passed on to
+    run_benchmark().
+    Returns (total_correct, total_scored); items that failed in transport
+    are left out of total_scored.
+    """
+    total_questions = len(questions)
+    previous_correct = 0
+    previous_scored = 0
+    previous_items = 0
+
+    pending_samples = {}
+    if completed is not None:
+        temperature_key = float(temperature)
+        remaining = []
+        for q in questions:
+            recorded = completed.get((model_name, temperature_key, q['task_id']), {})
+            # An unsampled row completes a single-sample run but is not a sample of a --samples run
+            recorded = {0 if index is None else index: result for index, result in recorded.items()
+                        if (index is None and SAMPLES == 1) or (index is not None and index < SAMPLES)}
+            previous_correct += sum(result == 'Correct' for result in recorded.values())
+            previous_scored += len(recorded)
+            previous_items += bool(recorded)
+            if len(recorded) < SAMPLES:
+                remaining.append(q)
+                if recorded:
+                    pending_samples[q['task_id']] = [i for i in range(SAMPLES) if i not in recorded]
+        print(f"{log_prefix}Resuming: {total_questions - len(remaining)} of {total_questions} "
+              f"items already completed, {len(remaining)} remaining")
+        questions = remaining
+
+    stop_check = None
+    stop_reason = None
+    if early_stopping is not None:
+        run_key = (model_name, float(temperature))
+        stop_reason = early_stopping.update(run_key, previous_correct, previous_scored,
+                                            previous_items)
+        if stop_reason:
+            questions = []
+        elif early_stopping.target is None and not early_stopping.rivals(run_key):
+            print(f"{log_prefix}Adaptive: no other run at temperature {temperature} has results "
+                  f"yet, so this run cannot stop early until one does")
+        stop_check = lambda correct, scored, items: early_stopping.update(
+            run_key, previous_correct + correct, previous_scored + scored, previous_items + items
+        )
+
+    print(f"\n--- Starting Benchmark for model: {model_name} (temperature {temperature}) ---")
+
+    preload = None
+    if questions and not api_provider and OLLAMA_NATIVE and OLLAMA_PRELOAD:
+        endpoints = local_endpoints()
+        with ThreadPoolExecutor(max_workers=max(1, len(endpoints))) as executor:
+            loads = list(executor.map(lambda endpoint: preload_model(model_name, endpoint), endpoints))
+        for endpoint, load in zip(endpoints, loads):
+            if load is None:
+                continue
+            where = f" on {endpoint}" if len(endpoints) > 1 else ""
+            print(f"{log_prefix}Loaded {model_name}{where} in {load[0]:.2f} s "
+                  f"(warm-up {load[1]:.2f} s), keep_alive {OLLAMA_KEEP_ALIVE}")
+        loads = [load for load in loads if load is not None]
+        if loads:
+            preload = (max(load[0] for load in loads), max(load[1] for load in loads))
+
+    total_correct, total_scored, total_errors, run_stop_reason = run_benchmark(
+        questions, model_name, temperature, api_provider, writer,
+        concurrency=concurrency, log_prefix=log_prefix, stop_check=stop_check,
+        pending_samples=pending_samples, slots=slots
+    )
+    stop_reason = stop_reason or run_stop_reason
+    total_correct += previous_correct
+    total_scored += previous_scored
+
+    accuracy = total_correct / total_scored if total_scored else 0
+    print(f"\n--- Benchmark Complete ---")
+    print(f"Model: {model_name}")
+    print(f"Temperature: {temperature}")
+    if SAMPLES > 1:
+        print(f"Samples per item: {SAMPLES}")
+    print(f"Score: {total_correct} / {total_scored}")
+    print(f"Accuracy: {accuracy:.2%}")
+    if preload is not None:
+        print(f"Model load (before timing): {preload[0]:.2f} s")
+    if early_stopping is not None:
+        low, high = early_stopping.interval(run_key)
+        print(f"Accuracy interval: {low:.2%} - {high:.2%}")
+        if stop_reason:
+            print(f"Stopped early after {total_scored} of {total_questions * SAMPLES} answers: "
+                  f"{stop_reason}")
+    elif stop_reason:
+        print(f"Stopped after {total_scored} of {total_questions * SAMPLES} answers: {stop_reason}")
+    if total_errors:
+        print(f"Transport errors (not scored, retried by --resume): {total_errors}")
+    return total_correct, total_scored
+
+def plan_sweep(models, temperatures, api_provider=None):
+    """Order a model x temperature grid into chains of runs.
+
+    All local (Ollama) models share a single chain, grouped by model so each
+    one is loaded once and all of its temperatures run back-to-back. Each
+    cloud model gets its own chain so it can run alongside the local one.
+    Each run is a (model_name, temperature, api_provider) tuple.
+    """
+    local_chain = []
+    cloud_chains = []
+    for model_name in models:
+        provider = api_provider or detect_api_provider(model_name)
+        runs = [(model_name, temperature, provider) for temperature in temperatures]
+        if provider:
+            cloud_chains.append(runs)
+        else:
+            local_chain.extend(runs)
+    return ([local_chain] if local_chain else []) + cloud_chains
+
+def run_sweep(chains, questions, writer, concurrency=1, completed=None, early_stopping=None):
+    """Run each chain sequentially, with the chains themselves in parallel.
+
+    The chains share ``concurrency``: at most that many requests are in
+    flight across all of them at once.
+    Returns a list of (model_name, temperature, total_correct, total_scored).
+    """
+    slots = FairSemaphore(max(1, concurrency))
+
+    def run_chain(chain):
+        scores = []
+        for model_name, temperature, provider in chain:
+            if _interrupted.is_set():
+                break
+            correct, total = run_model(questions, model_name, temperature, provider, writer,
+                                       concurrency=concurrency, completed=completed,
+                                       early_stopping=early_stopping, slots=slots,
+                                       log_prefix=f"[{model_name} T={temperature}] ")
+            scores.append((model_name, temperature, correct, total))
+        return scores
+
+    _interrupted.clear()
+    with ThreadPoolExecutor(max_workers=max(1, len(chains))) as executor:
+        futures = [executor.submit(run_chain, chain) for chain in chains]
+        try:
+            return [score for future in futures for score in future.result()]
+        except KeyboardInterrupt:
+            # Runs stop after the items they have in hand; leaving the with
+            # block waits for them, so every row they produced is written
+            print("\nInterrupted: finishing the requests in flight")
+            _interrupted.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+def make_custom_id(model_name, temperature, task_id):
+    """Batch custom_id for one item: "<model>|<temperature>|<task_id>"."""
+    return f"{model_name}|{float(temperature)}|{task_id}"
+
+def parse_custom_id(custom_id):
+    """Inverse of make_custom_id(); returns (model_name, temperature, task_id)."""
+    model_name, temperature, task_id = custom_id.rsplit('|', 2)
+    return model_name, float(temperature), task_id
+
+def export_batch(path, questions, models, temperatures):
+    """Write one batch-API request line per item, model and temperature.
+
+    Lines follow the OpenAI batch input format; submit one file per model,
+    as cloud batch endpoints generally require. Returns the number of lines.
+    """
+    count = 0
+    with open(path, 'w') as f:
+        for model_name in models:
+            for temperature in temperatures:
+                for question in questions:
+                    body = {
+                        "model": model_name,
+                        "messages": build_messages(build_prompt(question)),
+                        "temperature": temperature,
+                        "max_tokens": 1000
+                    }
+                    if STRUCTURED_OUTPUT:
+                        schema = build_answer_schema(question)
+                        body["response_format"] = build_response_format(schema)
+                        body["max_tokens"] = answer_max_tokens(schema)
+                    request = {
+                        "custom_id": make_custom_id(model_name, temperature, question['task_id']),
+                        "method": "POST",
+                        "url": "/v1/chat/completions",
+                        "body": body
+                    }
+                    f.write(json.dumps(request) + "\n")
+                    count += 1
+    return count
+
+def process_batch(input_path, output_path, concurrency=1, api_provider=None):
+    """Local stand-in for a batch endpoint.
+
+    Sends every request in a batch input file through get_llm_response()
+    and writes a results file in the OpenAI batch output format, so the
+    export -> process -> ingest path can be run end to end without a cloud
+    batch service. Returns the number of requests processed.
+    """
+    with open(input_path, 'r') as f:
+        requests_in = [json.loads(line) for line in f if line.strip()]
+
+    def process(request):
+        body = request['body']
+        provider = api_provider or detect_api_provider(body['model'])
+        prompt_text = body['messages'][-1]['content']
+        schema = (body.get('response_format') or {}).get('json_schema', {}).get('schema')
+        max_tokens = body.get('max_tokens') if schema is not None else None
+        details = {}
+        answer = get_llm_response(prompt_text, body['model'], body.get('temperature', 0), provider,
+                                  details=details, schema=schema, max_tokens=max_tokens)
+        return answer, details
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        try:
+            outcomes = list(executor.map(process, requests_in))
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    with open(output_path, 'w') as f:
+        for n, (request, (answer, details)) in enumerate(zip(requests_in, outcomes)):
+            line = {"id": f"batch_req_{n}", "custom_id": request['custom_id'], "response": None, "error": None}
+            if answer and answer.get("transport_error"):
+                line["error"] = {"code": "transport_error", "message": answer.get("error")}
+            else:
+                content = json.dumps(answer) if answer and "error" not in answer else ""
+                line["response"] = {
+                    "status_code": 200,
+                    "body": {
+                        "model": request['body']['model'],
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]
+                    }
+                }
+                usage = {key: details[key] for key in ('prompt_tokens', 'completion_tokens')
+                         if key in details}
+                if usage:
+                    line["response"]["body"]["usage"] = usage
+            f.write(json.dumps(line) + "\n")
+    return len(requests_in)
+
+def ingest_batch(path, questions, writer):
+    """Score a batch results file and hand all rows to ``writer`` at once.
+
+    Returns a dict mapping (model_name, temperature) to [correct, scored].
+    """
+    questions_by_id = {q['task_id']: q for q in questions}
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    rows = []
+    scores = {}
+
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            model_name, temperature, task_id = parse_custom_id(record['custom_id'])
+            question = questions_by_id.get(task_id)
+            if question is None:
+                print(f"Skipping {record['custom_id']}: task_id not found in {ITEMS_FILE}")
+                continue
+
+            response = record.get('response') or {}
+            usage = {}
+            raw_response_text = ""
+            if record.get('error') or response.get('status_code') != 200:
+                error = record.get('error') or {"message": f"HTTP {response.get('status_code')}"}
+                llm_answer = transport_error(error.get('message'))
+            else:
+                raw_response_text = response['body']['choices'][0]['message'].get('content') or ""
+                record_usage(usage, response['body'].get('usage'))
+                try:
+                    llm_answer = parse_json_answer(raw_response_text)
+                except json.JSONDecodeError:
+                    llm_answer = {"error": "Invalid JSON response from model"}
+
+            result, _ = score_response(question, llm_answer)
+            rows.append({
+                'timestamp': timestamp,
+                'model_name': model_name,
+                'temperature': temperature,
+                'task_id': task_id,
+                'domain': question['domain'],
+                'result': result,
+                'http_status': response.get('status_code'),
+                'parsed_answer': serialize_answer(llm_answer),
+                'raw_response': raw_response_text,
+                **usage
+            })
+            score = scores.setdefault((model_name, temperature), [0, 0])
+            if result != 'Error':
+                score[0] += result == 'Correct'
+                score[1] += 1
+
+    writer.add_rows(rows)
+    return scores
+
+def load_sweep_config(path):
+    """Read models and temperatures from a JSON sweep file.
+
+    The file holds {"models": [...], "temperatures": [...]}.
+    """
+    with open(path, 'r') as f:
+        config = json.load(f)
+    return config.get('models', []), [float(t) for t in config.get('temperatures', [])]
+
+def parse_keep_alive(value):
+    """Ollama keep_alive from the command line: seconds as a number, else a duration like "10m"."""
+    try:
+        return float(value) if '.' in value else int(value)
+    except ValueError:
+        return value
+
+def parse_list(value, cast=str):
+    """Split a comma-separated command line value."""
+    return [cast(item.strip()) for item in value.split(',') if item.strip()]
+
+def parse_shard(value):
+    """--shard "i/N" as a (number, count) pair, with number from 1 to N."""
+    try:
+        number, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, e.g. 1/4, not {value!r}")
+    if count < 1 or not 1 <= number <= count:
+        raise argparse.ArgumentTypeError(f"shard {value} is out of range: use 1/N to N/N")
+    return number, count
+
+def item_matches(item, filters):
+    """Whether an item from items.jsonl passes the same filters item_bank.read_items() applies."""
+    for field, key in (('domain', 'domains'), ('module', 'modules'),
+                       ('difficulty', 'difficulties'), ('task_id', 'task_ids')):
+        if filters.get(key) and item.get(field) not in filters[key]:
+            return False
+    if filters.get('tags') and not set(filters['tags']) & set(item.get('tags') or []):
+        return False
+    if filters.get('shard') and not item_bank.in_shard(item['task_id'], filters['shard']):
+        return False
+    return True
+
+def load_questions(items_file=ITEMS_FILE, bank_path=item_bank.ITEM_BANK, **filters):
+    """Load the items to run, applying any filters (see item_bank.read_items()).
+
+    Reads the compiled item bank when it is up to date with ``items_file``,
+    so only matching items are parsed and their prompts come pre-rendered;
+    otherwise falls back to parsing ``items_file``. Returns the items and
+    where they came from.
+    """
+    if bank_path and os.path.exists(bank_path):
+        if item_bank.is_current(bank_path, items_file):
+            return item_bank.read_items(bank_path, **filters), bank_path
+        print(f"Warning: {bank_path} is out of date with {items_file}; reading {items_file} instead. "
+              f"Run: python3 compile_items.py")
+    with open(items_file, 'r') as f:
+        questions = [json.loads(line) for line in f if line.strip()]
+    return [question for question in questions if item_matches(question, filters)], items_file
+
 def main():
     """Main function to run the benchmark."""
     parser = argparse.ArgumentParser(description='Run language model benchmark')
-    parser.add_argument('--model_name', type=str, required=True, help='Name of the model to test')
-    parser.add_argument('--temperature', type=float, required=True, help='Temperature setting for the model')
+    parser.add_argument('--model_name', type=str, help='Name of the model to test')
+    parser.add_argument('--temperature', type=float, help='Temperature setting for the model')
+    parser.add_argument('--models', type=str,
+                       help='Comma-separated models to sweep (e.g. "gemma3:4b,gpt-4")')
+    parser.add_argument('--temperatures', type=str,
+                       help='Comma-separated temperatures to sweep (e.g. "0.1,0.7")')
+    parser.add_argument('--sweep_config', type=str,
+                       help='JSON file with "models" and "temperatures" lists to sweep')
     parser.add_argument('--output_file', type=str, default='results.csv', help='Output CSV file name')
+    parser.add_argument('--results_format', type=str, choices=['csv', 'parquet'], default='csv',
+                       help='Write results to the CSV file or to a partitioned Parquet store (default: csv)')
+    parser.add_argument('--results_store', type=str, default=results_store.RESULTS_STORE,
+                       help=f'Parquet results store directory (default: {results_store.RESULTS_STORE})')
     parser.add_argument('--api_provider', type=str, choices=list(API_PROVIDERS.keys()), 
                        help='API provider (auto-detected if not specified)')
-    
+    parser.add_argument('--concurrency', type=int, default=1,
+                       help='Maximum number of items in flight at once, shared by all runs of a sweep (default: 1)')
+    parser.add_argument('--pool_size', type=int, default=HTTP_POOL_SIZE,
+                       help=f'Keep-alive connections per backend (default: {HTTP_POOL_SIZE})')
+    parser.add_argument('--timeout', type=float, default=REQUEST_TIMEOUT,
+                       help=f'Per-request timeout in seconds (default: {REQUEST_TIMEOUT})')
+    parser.add_argument('--no_cache', action='store_true',
+                       help='Do not read or write the response cache')
+    parser.add_argument('--cache_sampled', action='store_true',
+                       help='Also cache responses at temperature > 0 (bypassed by default)')
+    parser.add_argument('--cache_file', type=str, default=CACHE_FILE,
+                       help=f'Response cache database (default: {CACHE_FILE})')
+    parser.add_argument('--cache_max_entries', type=int, default=CACHE_MAX_ENTRIES,
+                       help=f'Maximum cached responses kept (default: {CACHE_MAX_ENTRIES})')
+    parser.add_argument('--cache_max_age_days', type=float, default=CACHE_MAX_AGE_DAYS,
+                       help=f'Drop cached responses older than this (default: {CACHE_MAX_AGE_DAYS})')
+    parser.add_argument('--max_retries', type=int, default=MAX_RETRIES,
+                       help=f'Retries for transient request failures (default: {MAX_RETRIES})')
+    parser.add_argument('--stream', action='store_true',
+                       help='Stream replies and stop as soon as the answer JSON is complete')
+    parser.add_argument('--structured', action='store_true',
+                       help="Constrain replies to each item's JSON schema (structured outputs)")
+    parser.add_argument('--pack', type=int, default=1,
+                       help='Answer this many items per request (default: 1, no packing)')
+    parser.add_argument('--endpoints', type=str,
+                       help='Comma-separated base URLs of local servers to share the run '
+                            '(e.g. "http://gpu1:11434,http://gpu2:11434"; default: the one local server)')
+    parser.add_argument('--ollama_native', action='store_true',
+                       help="Use Ollama's native /api/chat: preloads each model and sets keep_alive, num_ctx and num_predict")
+    parser.add_argument('--keep_alive', type=str, default=OLLAMA_KEEP_ALIVE,
+                       help=f'With --ollama_native, how long Ollama keeps the model loaded, e.g. "10m" or -1 '
+                            f'for ever (default: {OLLAMA_KEEP_ALIVE})')
+    parser.add_argument('--num_ctx', type=int,
+                       help="With --ollama_native, the model's context size (default: Ollama's)")
+    parser.add_argument('--num_predict', type=int,
+                       help='With --ollama_native, the most tokens to generate per reply (default: Ollama\'s)')
+    parser.add_argument('--no_preload', action='store_true',
+                       help='With --ollama_native, do not load and warm up each model before its run')
+    parser.add_argument('--samples', type=int, default=SAMPLES,
+                       help='Answers sampled per item, e.g. to measure accuracy at temperature > 0 '
+                            f'(default: {SAMPLES})')
+    parser.add_argument('--resume', action='store_true',
+                       help='Skip items already recorded for this model and temperature in the output file')
+    parser.add_argument('--export_batch', type=str, metavar='PATH',
+                       help='Write batch-API request JSONL for the model/temperature grid and exit')
+    parser.add_argument('--process_batch', type=str, nargs=2, metavar=('INPUT', 'OUTPUT'),
+                       help='Run a batch request file through the configured backends and write batch results')
+    parser.add_argument('--ingest_batch', type=str, metavar='PATH',
+                       help='Score a batch results JSONL and append the rows to the output file')
+    parser.add_argument('--adaptive', action='store_true',
+                       help='Ask items in stratified random order and stop each run once its accuracy is settled')
+    parser.add_argument('--target_accuracy', type=float,
+                       help='With --adaptive, stop once accuracy is confidently above or below this '
+                            '(default: stop once the ranking against the other runs is settled)')
+    parser.add_argument('--confidence', type=float, default=ADAPTIVE_CONFIDENCE,
+                       help=f'Confidence level for --adaptive stopping (default: {ADAPTIVE_CONFIDENCE})')
+    parser.add_argument('--min_items', type=int, default=ADAPTIVE_MIN_ITEMS,
+                       help=f'Items to score before --adaptive may stop a run (default: {ADAPTIVE_MIN_ITEMS})')
+    parser.add_argument('--adaptive_seed', type=int, default=ADAPTIVE_SEED,
+                       help=f'Seed for the --adaptive item order (default: {ADAPTIVE_SEED})')
+    parser.add_argument('--item_bank', type=str, default=item_bank.ITEM_BANK,
+                       help=f'Compiled item bank from compile_items.py, used when up to date '
+                            f'(default: {item_bank.ITEM_BANK})')
+    parser.add_argument('--domains', type=str, help='Comma-separated domains to run (default: all)')
+    parser.add_argument('--modules', type=str, help='Comma-separated modules to run (default: all)')
+    parser.add_argument('--difficulty', type=str,
+                       help='Comma-separated difficulty levels to run, e.g. "1,2" (default: all)')
+    parser.add_argument('--tags', type=str, help='Comma-separated tags; run items with any of them')
+    parser.add_argument('--task_ids', type=str, help='Comma-separated task_ids to run')
+    parser.add_argument('--shard', type=parse_shard, metavar='I/N',
+                       help='Run only shard I of N disjoint slices of the items, e.g. 2/4, to split a '
+                            'run across machines')
+
     args = parser.parse_args()
-    
-    # Auto-detect API provider if not specified
-    api_provider = args.api_provider or detect_api_provider(args.model_name)
+    configure_clients(pool_size=args.pool_size, timeout=args.timeout, max_retries=args.max_retries)
+    configure_requests(stream=args.stream, structured=args.structured, pack_size=args.pack,
+                       samples=max(1, args.samples))
+    configure_ollama(native=args.ollama_native, keep_alive=parse_keep_alive(args.keep_alive),
+                     num_ctx=args.num_ctx, num_predict=args.num_predict,
+                     preload=not args.no_preload)
+    endpoint_pool = configure_endpoints(parse_list(args.endpoints) if args.endpoints else None)
+
+    if args.process_batch:
+        cache = open_response_cache(args)
+        try:
+            count = process_batch(args.process_batch[0], args.process_batch[1],
+                                  concurrency=args.concurrency, api_provider=args.api_provider)
+        finally:
+            close_clients()
+            if cache is not None:
+                configure_cache(None)
+                cache.close()
+        print(f"Processed {count} batch requests into {args.process_batch[1]}")
+        return
+
+    # Build the model x temperature grid (a single run is a 1 x 1 grid)
+    models = parse_list(args.models) if args.models else []
+    temperatures = parse_list(args.temperatures, float) if args.temperatures else []
+    if args.sweep_config:
+        config_models, config_temperatures = load_sweep_config(args.sweep_config)
+        models = models or config_models
+        temperatures = temperatures or config_temperatures
+    if args.model_name:
+        models = models or [args.model_name]
+    if args.temperature is not None:
+        temperatures = temperatures or [args.temperature]
+    if (not models or not temperatures) and not args.ingest_batch:
+        parser.error("specify --model_name and --temperature, or --models/--temperatures/--sweep_config")
+    is_sweep = len(models) > 1 or len(temperatures) > 1
+
+    chains = plan_sweep(models, temperatures, args.api_provider)
     
     # Ensure results directory exists and prepend to output file
     results_dir = 'results'
@@ -248,71 +2322,131 @@ def main():
     # If output_file doesn't already include the results directory, prepend it
     if not args.output_file.startswith('results/'):
         args.output_file = os.path.join(results_dir, args.output_file)
-    
-    print(f"--- Stata Benchmark Runner ---")
-    print(f"Model: {args.model_name}")
-    print(f"Temperature: {args.temperature}")
-    print(f"API Provider: {api_provider or 'Local (Ollama)'}")
-    print(f"Output file: {args.output_file}")
-    
-    # Only check local server status if not using API
-    if not api_provider and not check_server_status():
-        return
 
+    filters = {
+        'domains': parse_list(args.domains) if args.domains else None,
+        'modules': parse_list(args.modules) if args.modules else None,
+        'difficulties': parse_list(args.difficulty, int) if args.difficulty else None,
+        'tags': parse_list(args.tags) if args.tags else None,
+        'task_ids': parse_list(args.task_ids) if args.task_ids else None,
+        'shard': args.shard,
+    }
     try:
-        with open(ITEMS_FILE, 'r') as f:
-            questions = [json.loads(line) for line in f]
+        questions, source = load_questions(ITEMS_FILE, args.item_bank, **filters)
     except FileNotFoundError:
         print(f"Error: The file '{ITEMS_FILE}' was not found in this directory.")
         return
+    if any(filters.values()):
+        shard = f", shard {args.shard[0]}/{args.shard[1]}" if args.shard else ""
+        print(f"Loaded {len(questions)} matching items from {source}{shard}")
+        if not questions:
+            print("Error: No items match the filters.")
+            return
+
+    if args.export_batch:
+        count = export_batch(args.export_batch, questions, models, temperatures)
+        print(f"Wrote {count} batch requests to {args.export_batch}")
+        return
 
+    if args.results_format == 'parquet':
+        if results_store.pa is None:
+            print("Error: pyarrow is required for --results_format parquet. Run: pip install pyarrow")
+            return
+        os.makedirs(args.results_store, exist_ok=True)
+        writer = ResultsWriter(store_dir=args.results_store)
+        print(f"Writing to Parquet results store: {args.results_store}")
     # Initialize CSV file if it doesn't exist
-    if not os.path.exists(args.output_file):
+    elif not os.path.exists(args.output_file):
         write_csv_header(args.output_file)
+        writer = ResultsWriter(output_file=args.output_file)
         print(f"Created new CSV file: {args.output_file}")
     else:
+        if repair_partial_row(args.output_file):
+            print(f"Removed a partially written row from {args.output_file}")
+        try:
+            if upgrade_csv_header(args.output_file):
+                print(f"Added new columns to the header of {args.output_file}")
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        writer = ResultsWriter(output_file=args.output_file)
         print(f"Appending to existing CSV file: {args.output_file}")
 
-    total_questions = len(questions)
-    total_correct = 0
+    if args.ingest_batch:
+        scores = ingest_batch(args.ingest_batch, questions, writer)
+        writer.close()
+        print(f"\n--- Batch Ingest Complete ---")
+        for (model_name, temperature), (correct, total) in scores.items():
+            accuracy = correct / total if total else 0
+            print(f"{model_name:30} T={temperature:<5} {accuracy:7.2%} ({correct}/{total})")
+        print(f"Results saved to: {writer.location}")
+        return
+    
+    print(f"--- Stata Benchmark Runner ---")
+    if is_sweep:
+        print(f"Models: {', '.join(models)}")
+        print(f"Temperatures: {', '.join(str(t) for t in temperatures)}")
+    else:
+        print(f"Model: {models[0]}")
+        print(f"Temperature: {temperatures[0]}")
+        print(f"API Provider: {chains[0][0][2] or 'Local (Ollama)'}")
+    print(f"Output: {writer.location}")
+    print(f"Concurrency: {args.concurrency}")
+    if endpoint_pool is not None:
+        print(f"Local endpoints: {', '.join(endpoint_pool.endpoints)} "
+              f"(up to {endpoint_pool.slots} requests each)")
+    if args.pack > 1:
+        print(f"Items per request: {args.pack}")
+    if args.samples > 1:
+        print(f"Samples per item: {args.samples}")
+    if args.ollama_native:
+        print(f"Ollama API: native (keep_alive {OLLAMA_KEEP_ALIVE}, num_ctx {OLLAMA_NUM_CTX or 'default'}, "
+              f"num_predict {OLLAMA_NUM_PREDICT or 'default'})")
 
-    print(f"\n--- Starting Benchmark for model: {args.model_name} ---")
+    early_stopping = None
+    if args.adaptive:
+        questions = stratified_order(questions, seed=args.adaptive_seed)
+        early_stopping = EarlyStopping(len(questions), confidence=args.confidence,
+                                       target=args.target_accuracy, min_items=args.min_items)
+        goal = (f"target accuracy {args.target_accuracy:.1%}" if args.target_accuracy is not None
+                else "settled ranking")
+        print(f"Adaptive: stopping at {goal}, {args.confidence:.0%} confidence, "
+              f"after at least {args.min_items} items")
+    
+    # Only check local server status if some model runs locally
+    needs_local = any(provider is None for chain in chains for _, _, provider in chain)
+    if needs_local and not check_server_status():
+        return
 
-    for i, question in enumerate(questions):
-        task_id = question["task_id"]
-        domain = question["domain"]
-        prompt = question["prompt"]
-        
-        if question['answer_type'] == 'multiple_choice':
-            choices_text = "\n".join([f"{idx}) {choice}" for idx, choice in enumerate(question['choices'])])
-            schema = '{"choice": <integer>}'
-            full_prompt = f"{prompt}\n\nChoices:\n{choices_text}\n\nAnswer with JSON using this schema:\n{schema}"
-        else: # structured_single
-            schema = json.dumps({k: v['type'] for k, v in question['output_schema']['properties'].items()})
-            full_prompt = f"{prompt}\n\nAnswer with JSON using this schema:\n{schema}"
-
-        print(f"\n({i+1}/{total_questions}) Running Task: {task_id}...")
-        
-        llm_answer = get_llm_response(full_prompt, args.model_name, args.temperature, api_provider)
-        
-        result, reason = score_response(question, llm_answer)
+    completed = load_completed_index(writer.location) if args.resume else None
 
-        if result == "Correct":
-            total_correct += 1
-        
-        # Append result to CSV immediately after scoring
-        append_result_to_csv(args.output_file, args.model_name, args.temperature, task_id, domain, result)
-        
-        print(f"  > Result: {result} ({reason})")
-        time.sleep(1)
+    cache = open_response_cache(args)
+    try:
+        scores = run_sweep(chains, questions, writer,
+                           concurrency=args.concurrency, completed=completed,
+                           early_stopping=early_stopping)
+    except KeyboardInterrupt:
+        # The finally clause below flushes the rows buffered so far
+        print(f"Interrupted. Results so far saved to: {writer.location}; "
+              f"re-run with --resume to continue.")
+        raise
+    finally:
+        writer.close()
+        close_clients()
+        if cache is not None:
+            configure_cache(None)
+            cache.close()
 
-    accuracy = total_correct / total_questions
-    print(f"\n--- Benchmark Complete ---")
-    print(f"Model: {args.model_name}")
-    print(f"Temperature: {args.temperature}")
-    print(f"Score: {total_correct} / {total_questions}")
-    print(f"Accuracy: {accuracy:.2%}")
-    print(f"Results saved to: {args.output_file}")
+    if is_sweep:
+        print(f"\n--- Sweep Complete ---")
+        for model_name, temperature, correct, total in scores:
+            accuracy = correct / total if total else 0
+            print(f"{model_name:30} T={temperature:<5} {accuracy:7.2%} ({correct}/{total})")
+    print(f"Results saved to: {writer.location}")
+    if cache is not None:
+        print(cache.stats_line())
+    if endpoint_pool is not None:
+        print(endpoint_pool.stats_line())
 
 
 if __name__ == "__main__":
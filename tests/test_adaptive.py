@@ -0,0 +1,17 @@
+"""--adaptive stopping counts items, not sampled answers."""
+
+from run_benchmark import EarlyStopping
+
+def test_min_items_counts_items_not_samples():
+    stopping = EarlyStopping(100, min_items=30)
+    stopping.update(('weak', 0.7), 0, 90, items=30)
+    # 60 answers, all correct, but only 20 items: too early to stop
+    assert stopping.update(('strong', 0.7), 60, 60, items=20) is None
+    assert stopping.update(('strong', 0.7), 90, 90, items=30) is not None
+
+def test_rank_mode_needs_a_rival():
+    stopping = EarlyStopping(100, min_items=30)
+    assert stopping.rivals(('first', 0.7)) == 0
+    assert stopping.update(('first', 0.7), 100, 100) is None
+    assert stopping.rivals(('second', 0.7)) == 1
+    assert stopping.rivals(('second', 0.1)) == 0
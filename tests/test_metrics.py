@@ -0,0 +1,53 @@
+"""Cost and token metrics must not count a multi-sample request more than once."""
+
+import pandas as pd
+import pytest
+
+import analyze_results
+import run_benchmark
+
+PRICES = {'gpt-4': (30.0, 60.0)}
+
+def fake_multi_sample_response(prompt_text, model_name, temperature, api_provider, details=None,
+                               schema=None, max_tokens=None, samples=1):
+    """One request answering ``samples`` times: 100 prompt and 40 completion tokens in all."""
+    details.update({'http_status': 200, 'answer_s': 2.0, 'prompt_tokens': 100,
+                    'completion_tokens': 40})
+    details['raw_responses'] = [f'{{"choice": {i % 2}}}' for i in range(samples)]
+    return [{'choice': i % 2} for i in range(samples)]
+
+def aggregate(rows):
+    """Aggregates of result rows, as analyze_results.py builds them."""
+    df = pd.DataFrame(rows)
+    return analyze_results.Aggregates(
+        analyze_results.build_cube(df), analyze_results.build_items(df),
+        analyze_results.build_histograms(df), analyze_results.build_usage(df),
+        analyze_results.build_answers(df),
+    )
+
+def test_multi_sample_cost(monkeypatch):
+    monkeypatch.setattr(run_benchmark, 'get_api_response', fake_multi_sample_response)
+    samples = run_benchmark.get_llm_samples('prompt', 'gpt-4', 0.7, 'openai', samples=4)
+
+    rows = []
+    for sample_index, (answer, details) in enumerate(samples):
+        rows.append(dict(details, model_name='gpt-4', temperature=0.7, task_id='MC-1',
+                         domain='logic', pack_size=1, sample_index=sample_index,
+                         parsed_answer=run_benchmark.serialize_answer(answer),
+                         result='Correct' if answer['choice'] == 0 else 'Incorrect'))
+    metrics = analyze_results.model_metrics(aggregate(rows), PRICES)
+
+    # 40 completion tokens over 4 answers, and one request's cost over its 2 correct answers
+    assert metrics.loc['gpt-4', 'tokens_per_item'] == 10
+    request_cost = (100 * 30.0 + 40 * 60.0) / 1e6
+    assert metrics.loc['gpt-4', 'cost_per_correct'] == pytest.approx(request_cost / 2)
+    assert metrics.loc['gpt-4', 'tokens_per_s'] == 20
+
+def test_single_sample_rows_add_no_answers():
+    rows = pd.DataFrame({
+        'model_name': ['gpt-4'] * 3, 'temperature': [0.1] * 3, 'task_id': ['MC-1', 'MC-2', 'MC-1'],
+        'result': ['Correct', 'Incorrect', 'Correct'], 'parsed_answer': ['{"choice": 1}'] * 3,
+        'sample_index': [None, None, 1],
+    })
+    answers = analyze_results.build_answers(rows)
+    assert answers['count'].sum() == 1
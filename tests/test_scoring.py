@@ -0,0 +1,50 @@
+"""Re-scoring stored answers must give the same verdicts as the live run."""
+
+import json
+
+import pandas as pd
+import pytest
+
+from rescore_results import rescore
+from run_benchmark import score_response
+
+MULTIPLE_CHOICE = {
+    'task_id': 'MC-1',
+    'answer_type': 'multiple_choice',
+    'choices': ['a', 'b', 'c', 'd'],
+    'correct_index': 1,
+    'scoring': {'method': 'choice_equals_index'},
+}
+
+def rescored_verdict(item, answer):
+    """Verdict rescore() gives a stored answer to ``item``."""
+    df = pd.DataFrame([{
+        'task_id': item['task_id'],
+        'result': 'Incorrect',
+        'parsed_answer': json.dumps(answer),
+        'raw_response': '',
+    }])
+    rules = pd.DataFrame([{
+        'task_id': item['task_id'],
+        'method': item['scoring']['method'],
+        'correct_index': item.get('correct_index'),
+        'expected_value': item['scoring'].get('expected_value'),
+        'accepted_phrases': item['scoring'].get('accepted_phrases', []),
+    }], dtype=object)
+    return rescore(df, rules).iloc[0]
+
+@pytest.mark.parametrize('answer, expected', [
+    ({'choice': 1}, 'Correct'),
+    ({'choice': 2}, 'Incorrect'),
+    ({'choice': '1'}, 'Correct'),
+    # int() truncates a float choice...
+    ({'choice': 1.7}, 'Correct'),
+    # ...but does not parse a float written as a string
+    ({'choice': '1.0'}, 'Incorrect'),
+    ({'choice': 'b'}, 'Incorrect'),
+    ({'choice': None}, 'Incorrect'),
+])
+def test_choice_rescore_matches_live(answer, expected):
+    live, _ = score_response(MULTIPLE_CHOICE, answer)
+    assert live == expected
+    assert rescored_verdict(MULTIPLE_CHOICE, answer) == expected